@@ -42,6 +42,8 @@ sys.path.append(os.path.dirname(os.path.realpath(__file__)))
 # import Pokemon Go API lib
 from pgoapi import pgoapi
 from pgoapi import utilities as util
+from pgoapi.inventory import iter_inventory_items
+from pgoapi.game_data import GameData, PokemonStats
 
 # other stuff
 from google.protobuf.internal import encoder
@@ -136,53 +138,44 @@ def main():
     if not api.login(config.auth_service, config.username, config.password):
         return
 
-    # get inventory call
+    # get inventory call, the response is kept serialized and only the
+    # pokemon entries are parsed below
     # ----------------------
-    api.get_inventory()
+    request = api.create_request()
+    request.get_inventory(_raw_response=True)
 
     # execute the RPC call
-    response_dict = api.call()
+    response_dict = request.call()
 
     approot = os.path.dirname(os.path.realpath(__file__))
 
-    with open(os.path.join(approot, 'data/moves.json')) as data_file:
-        moves = json.load(data_file)
-
-    with open(os.path.join(approot, 'data/pokemon.json')) as data_file:
-        pokemon = json.load(data_file)
-
-    def format(i):
-        i = i['inventory_item_data']['pokemon_data']
-        i = {
-            k: v
-            for k, v in i.items()
-            if k in [
-                'nickname', 'move_1', 'move_2', 'pokemon_id',
-                'individual_defense', 'stamina', 'cp', 'individual_stamina',
-                'individual_attack'
-            ]
-        }
-        i['individual_defense'] = i.get('individual_defense', 0)
-        i['individual_attack'] = i.get('individual_attack', 0)
-        i['individual_stamina'] = i.get('individual_stamina', 0)
-        i['power_quotient'] = round(
-            ((float(i['individual_defense']) + float(i['individual_attack']) +
-              float(i['individual_stamina'])) / 45) * 100)
-        i['name'] = list(
-            filter(lambda j: int(j['Number']) == i['pokemon_id'], pokemon))[0][
-                'Name']
-        i['move_1'] = list(
-            filter(lambda j: j['id'] == i['move_1'], moves))[0]['name']
-        i['move_2'] = list(
-            filter(lambda j: j['id'] == i['move_2'], moves))[0]['name']
-        return i
-
-    all_pokemon = filter(
-        lambda i: 'pokemon_data' in i['inventory_item_data'] and 'is_egg' not in i['inventory_item_data']['pokemon_data'],
-        response_dict['responses']['GET_INVENTORY']['inventory_delta'][
-            'inventory_items'])
-    all_pokemon = list(map(format, all_pokemon))
-    all_pokemon.sort(key=lambda x: x['power_quotient'], reverse=True)
+    game_data = GameData.from_files(
+        os.path.join(approot, 'data/pokemon.json'),
+        os.path.join(approot, 'data/moves.json'))
+
+    all_pokemon = [
+        item.inventory_item_data.pokemon_data
+        for item in iter_inventory_items(
+            response_dict['responses']['GET_INVENTORY'], ['pokemon_data'])
+        if not item.inventory_item_data.pokemon_data.is_egg
+    ]
+
+    stats = PokemonStats(all_pokemon)
+    names, moves_1, moves_2 = stats.get_names(game_data, move_names=True)
+    power_quotient = stats.get_power_quotient()
+
+    all_pokemon = [{
+        'name': names[i],
+        'nickname': all_pokemon[i].nickname,
+        'cp': stats.cp[i],
+        'stamina': all_pokemon[i].stamina,
+        'individual_attack': stats.attack[i],
+        'individual_defense': stats.defense[i],
+        'individual_stamina': stats.stamina[i],
+        'power_quotient': round(power_quotient[i]),
+        'move_1': moves_1[i],
+        'move_2': moves_2[i]
+    } for i in stats.rank(power_quotient)]
 
     print(tabulate(all_pokemon, headers="keys"))
 
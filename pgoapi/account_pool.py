@@ -0,0 +1,275 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from contextlib import contextmanager
+
+from pgoapi.exceptions import AuthException, BannedAccountException, CircuitBreakerOpenException, HashServerException, NianticThrottlingException, NoAvailableAccountException, NotLoggedInException, ServerBusyOrOfflineException
+
+log = logging.getLogger(__name__)
+
+
+class Account:
+    """ A PGoApi instance managed by an AccountPool plus its health state """
+
+    HEALTHY = 'healthy'
+    COOLDOWN = 'cooldown'
+    LOGGED_OUT = 'logged_out'
+    BANNED = 'banned'
+
+    def __init__(self, name, api, min_interval=0):
+        self.name = name
+        self.api = api
+        self.min_interval = min_interval
+
+        self.status = self.HEALTHY
+        self.leased = False
+        self.available_at = 0
+        self.last_lease = 0
+        self.failures = 0
+        self.throttled = 0
+        self.completed = 0
+        self.last_error = None
+
+    def get_status(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'leased': self.leased,
+            'available_in': max(0, self.available_at - time.time()),
+            'failures': self.failures,
+            'throttled': self.throttled,
+            'completed': self.completed,
+            'last_error': repr(self.last_error) if self.last_error else None
+        }
+
+
+class AccountPool:
+    """
+    Owns many PGoApi instances and leases them to tasks one at a time.
+
+    Every account is leased at most once per min_interval seconds. Failures
+    of a leased account are classified: banned accounts are retired,
+    throttled accounts cool down (doubling with every consecutive throttle)
+    and accounts which lost their login are re-authenticated by the relogin
+    callback before being leased again.
+    """
+
+    def __init__(self,
+                 min_interval=10,
+                 throttle_cooldown=60,
+                 max_cooldown=1800,
+                 error_cooldown=30,
+                 relogin=None):
+        self.min_interval = min_interval
+        self.throttle_cooldown = throttle_cooldown
+        self.max_cooldown = max_cooldown
+        self.error_cooldown = error_cooldown
+        self.relogin = relogin
+
+        self._accounts = []
+        self._condition = threading.Condition()
+
+    def add(self, api, name=None, min_interval=None):
+        if name is None:
+            name = 'account-{}'.format(len(self._accounts))
+        if min_interval is None:
+            min_interval = self.min_interval
+
+        account = Account(name, api, min_interval)
+        with self._condition:
+            self._accounts.append(account)
+            self._condition.notify()
+        return account
+
+    def remove(self, account):
+        with self._condition:
+            self._accounts.remove(account)
+
+    def get_accounts(self):
+        with self._condition:
+            return list(self._accounts)
+
+    def get_status(self):
+        with self._condition:
+            return [account.get_status() for account in self._accounts]
+
+    def _is_usable(self, account):
+        if account.status == Account.BANNED:
+            return False
+        return account.status != Account.LOGGED_OUT or self.relogin is not None
+
+    def acquire(self, timeout=None):
+        """ Returns the account which is available the longest, waits for one if needed """
+        end = None if timeout is None else time.time() + timeout
+
+        while True:
+            account = self._acquire(timeout, end)
+            if account.status != Account.LOGGED_OUT or self._relogin(account):
+                return account
+
+    def _acquire(self, timeout, end):
+        with self._condition:
+            while True:
+                usable = [a for a in self._accounts if self._is_usable(a)]
+                if not usable:
+                    raise NoAvailableAccountException(
+                        'No usable account left in the pool.')
+
+                now = time.time()
+                free = [a for a in usable if not a.leased]
+                ready = [a for a in free if a.available_at <= now]
+                if ready:
+                    account = min(ready, key=lambda a: a.last_lease)
+                    account.leased = True
+                    account.last_lease = now
+                    return account
+
+                wait = None
+                if free:
+                    wait = min(a.available_at for a in free) - now
+                if end is not None:
+                    remaining = end - now
+                    if remaining <= 0:
+                        raise NoAvailableAccountException(
+                            'No account available within {}s.'.format(timeout))
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._condition.wait(wait)
+
+    def release(self, account, error=None):
+        now = time.time()
+
+        with self._condition:
+            account.leased = False
+            account.available_at = max(account.available_at,
+                                       now + account.min_interval)
+
+            if error is None:
+                account.status = Account.HEALTHY
+                account.failures = 0
+                account.throttled = 0
+                account.completed += 1
+            elif isinstance(error, (HashServerException,
+                                    CircuitBreakerOpenException)):
+                # the hash server and circuit breakers are shared by all
+                # accounts, this one is not to blame
+                account.last_error = error
+            else:
+                account.failures += 1
+                account.last_error = error
+
+                if isinstance(error, BannedAccountException):
+                    account.status = Account.BANNED
+                    log.warning('Account %s is banned, retiring it.',
+                                account.name)
+                elif isinstance(error, NianticThrottlingException):
+                    account.throttled += 1
+                    cooldown = min(self.max_cooldown, self.throttle_cooldown *
+                                   2**(account.throttled - 1))
+                    account.status = Account.COOLDOWN
+                    account.available_at = now + cooldown
+                    log.info('Account %s throttled, cooling down for %ss.',
+                             account.name, cooldown)
+                elif isinstance(error, (NotLoggedInException, AuthException)):
+                    # logged in again by the relogin callback on its next lease
+                    account.status = Account.LOGGED_OUT
+                elif isinstance(error, ServerBusyOrOfflineException):
+                    account.status = Account.COOLDOWN
+                    account.available_at = now + self.error_cooldown
+
+            self._condition.notify_all()
+
+    def _relogin(self, account):
+        try:
+            self.relogin(account.api)
+        except BannedAccountException as e:
+            self.release(account, e)
+            return False
+        except Exception as e:
+            log.warning('Re-login of account %s failed: %s', account.name, e)
+            with self._condition:
+                account.leased = False
+                account.failures += 1
+                account.last_error = e
+                account.available_at = time.time() + self.error_cooldown
+                self._condition.notify_all()
+            return False
+
+        log.info('Account %s logged in again.', account.name)
+        with self._condition:
+            account.status = Account.HEALTHY
+        return True
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """
+        with pool.lease() as api:
+            api.get_player()
+        """
+        account = self.acquire(timeout)
+        try:
+            yield account.api
+        except Exception as e:
+            self.release(account, e)
+            raise
+        else:
+            self.release(account)
+
+    def run(self, task, retries=3, timeout=None):
+        """
+        Calls task(api) with a leased account. If the account fails with an
+        account or server problem the task is re-queued on another account,
+        up to retries times. Hash server and circuit open errors are raised
+        right away, every other account would fail the same way.
+        """
+        attempt = 0
+        while True:
+            account = self.acquire(timeout)
+            try:
+                result = task(account.api)
+            except (HashServerException, CircuitBreakerOpenException) as e:
+                self.release(account, e)
+                raise
+            except (BannedAccountException, NianticThrottlingException,
+                    NotLoggedInException, AuthException,
+                    ServerBusyOrOfflineException) as e:
+                self.release(account, e)
+                attempt += 1
+                if attempt > retries:
+                    raise
+                log.info('Task failed on account %s (%s), re-queueing.',
+                         account.name, e)
+                continue
+            except Exception as e:
+                self.release(account, e)
+                raise
+
+            self.release(account)
+            return result
@@ -25,9 +25,15 @@ Author: tjado <https://github.com/tejado>
 
 from __future__ import absolute_import
 
+import base64
 import logging
+import threading
 
 from pgoapi.utilities import get_time, get_format_time_diff
+from pgoapi.exceptions import AuthException
+
+from . import protos
+from pogoprotos.networking.envelopes.auth_ticket_pb2 import AuthTicket
 
 
 class Auth:
@@ -35,6 +41,7 @@ class Auth:
         self.log = logging.getLogger(__name__)
 
         self._auth_provider = None
+        self._username = None
 
         self._login = False
         """ 
@@ -53,16 +60,29 @@ class Auth:
         self._ticket_expire = None
         self._ticket_start = None
         self._ticket_end = None
+        # AuthTicket proto and its serialization, built once per ticket
+        self._ticket_proto = None
+        self._ticket_serialized = None
+        self._ticket_lock = threading.RLock()
+        # guards access token, expiry and login state against a refresh
+        # running on another thread
+        self._token_lock = threading.RLock()
 
     def get_name(self):
         return self._auth_provider
 
+    def get_username(self):
+        return self._username
+
     def is_login(self):
         return self._login
 
     def get_token(self):
         return self._access_token
 
+    def get_access_token_expiry(self):
+        return self._access_token_expiry
+
     def has_ticket(self):
         if self._ticket_expire and self._ticket_start and self._ticket_end:
             return True
@@ -70,7 +90,36 @@ class Auth:
             return False
 
     def set_ticket(self, params):
-        self._ticket_expire, self._ticket_start, self._ticket_end = params
+        with self._ticket_lock:
+            self._ticket_expire, self._ticket_start, self._ticket_end = params
+            self._ticket_proto = None
+            self._ticket_serialized = None
+
+    def update_ticket(self, params):
+        """
+        Stores the ticket if it expires later than the current one. The check
+        and the store are one step, so concurrent responses can't replace a
+        newer ticket with an older one. Returns whether it was stored.
+        """
+        expire_timestamp_ms = params[0]
+        with self._ticket_lock:
+            if not self.is_new_ticket(expire_timestamp_ms):
+                return False
+            had_ticket = self.has_ticket()
+            self.set_ticket(params)
+
+        if self.log.isEnabledFor(logging.DEBUG):
+            now_ms = get_time(ms=True)
+            h, m, s = get_format_time_diff(now_ms, expire_timestamp_ms, True)
+            if had_ticket:
+                self.log.debug(
+                    'Replacing old Session Ticket with new one valid for %02d:%02d:%02d hours (%s < %s)',
+                    h, m, s, now_ms, expire_timestamp_ms)
+            else:
+                self.log.debug(
+                    'Received Session Ticket valid for %02d:%02d:%02d hours (%s < %s)',
+                    h, m, s, now_ms, expire_timestamp_ms)
+        return True
 
     def is_new_ticket(self, new_ticket_time_ms):
         if self._ticket_expire is None or new_ticket_time_ms > self._ticket_expire:
@@ -79,29 +128,83 @@ class Auth:
             return False
 
     def check_ticket(self):
-        if self.has_ticket():
+        with self._ticket_lock:
+            if not self.has_ticket():
+                return False
+
             now_ms = get_time(ms=True)
             if now_ms < (self._ticket_expire - 10000):
-                h, m, s = get_format_time_diff(now_ms, self._ticket_expire,
-                                               True)
-                self.log.debug(
-                    'Session Ticket still valid for further %02d:%02d:%02d hours (%s < %s)',
-                    h, m, s, now_ms, self._ticket_expire)
+                if self.log.isEnabledFor(logging.DEBUG):
+                    h, m, s = get_format_time_diff(now_ms, self._ticket_expire,
+                                                   True)
+                    self.log.debug(
+                        'Session Ticket still valid for further %02d:%02d:%02d hours (%s < %s)',
+                        h, m, s, now_ms, self._ticket_expire)
                 return True
             else:
                 self.log.debug('Removed expired Session Ticket (%s < %s)',
                                now_ms, self._ticket_expire)
-                self._ticket_expire, self._ticket_start, self._ticket_end = (
-                    None, None, None)
+                self.set_ticket((None, None, None))
                 return False
-        else:
-            return False
 
     def get_ticket(self):
-        if self.check_ticket():
-            return (self._ticket_expire, self._ticket_start, self._ticket_end)
-        else:
-            return False
+        with self._ticket_lock:
+            if self.check_ticket():
+                return (self._ticket_expire, self._ticket_start,
+                        self._ticket_end)
+            else:
+                return False
+
+    def get_serialized_ticket(self):
+        """
+        Returns (AuthTicket proto, serialized bytes) of the valid session ticket
+        or False. Both are cached until the ticket is replaced by set_ticket.
+        """
+        with self._ticket_lock:
+            if not self.check_ticket():
+                return False
+
+            if self._ticket_serialized is None:
+                ticket = AuthTicket()
+                ticket.expire_timestamp_ms = self._ticket_expire
+                ticket.start = self._ticket_start
+                ticket.end = self._ticket_end
+                self._ticket_proto = ticket
+                self._ticket_serialized = ticket.SerializeToString()
+
+            return (self._ticket_proto, self._ticket_serialized)
+
+    def get_state(self):
+        """ Serializable snapshot of tokens and session ticket, see set_state """
+        ticket = None
+        if self.has_ticket():
+            ticket = [
+                self._ticket_expire,
+                base64.b64encode(self._ticket_start).decode('ascii'),
+                base64.b64encode(self._ticket_end).decode('ascii')
+            ]
+
+        return {
+            'provider': self._auth_provider,
+            'login': self._login,
+            'refresh_token': self._refresh_token,
+            'access_token': self._access_token,
+            'access_token_expiry': self._access_token_expiry,
+            'ticket': ticket
+        }
+
+    def set_state(self, state):
+        self._refresh_token = state.get('refresh_token')
+        self._access_token = state.get('access_token')
+        self._access_token_expiry = state.get('access_token_expiry', 0)
+        self._login = bool(state.get('login')) and self._access_token is not None
+
+        ticket = state.get('ticket')
+        if ticket:
+            expire, start, end = ticket
+            self.set_ticket([
+                expire, base64.b64decode(start), base64.b64decode(end)
+            ])
 
     def user_login(self, username, password):
         raise NotImplementedError()
@@ -109,9 +212,33 @@ class Auth:
     def set_refresh_token(self, username, password):
         raise NotImplementedError()
 
-    def get_access_token(self, force_refresh=False):
+    def get_access_token(self, force_refresh=False, deadline=None):
+        raise NotImplementedError()
+
+    def refresh_access_token(self, deadline=None):
+        """
+        Fetches a new access token without touching the current one, which
+        is only replaced on success. Unlike get_access_token a failure leaves
+        the provider as it was, so it is safe to call from a background thread.
+        """
+        token = self._fetch_access_token(deadline)
+        if token is None:
+            raise AuthException('Could not refresh the {} Access Token'.format(
+                self._auth_provider))
+
+        self._set_access_token(*token)
+        return token[0]
+
+    def _fetch_access_token(self, deadline=None):
+        """ Returns (access_token, expiry) or None if none was issued """
         raise NotImplementedError()
 
+    def _set_access_token(self, access_token, expiry):
+        with self._token_lock:
+            self._access_token = access_token
+            self._access_token_expiry = expiry
+            self._login = access_token is not None
+
     def check_access_token(self):
         """
         Add few seconds to now so the token get refreshed 
@@ -119,18 +246,23 @@ class Auth:
         """
         now_s = get_time() + 120
 
-        if self._access_token is not None:
-            if self._access_token_expiry == 0:
+        with self._token_lock:
+            access_token = self._access_token
+            access_token_expiry = self._access_token_expiry
+
+        if access_token is not None:
+            if access_token_expiry == 0:
                 self.log.debug(
                     'No Access Token Expiry found - assuming it is still valid!'
                 )
                 return True
-            elif self._access_token_expiry > now_s:
-                h, m, s = get_format_time_diff(
-                    now_s, self._access_token_expiry, False)
-                self.log.debug(
-                    'Access Token still valid for further %02d:%02d:%02d hours (%s < %s)',
-                    h, m, s, now_s, self._access_token_expiry)
+            elif access_token_expiry > now_s:
+                if self.log.isEnabledFor(logging.DEBUG):
+                    h, m, s = get_format_time_diff(
+                        now_s, access_token_expiry, False)
+                    self.log.debug(
+                        'Access Token still valid for further %02d:%02d:%02d hours (%s < %s)',
+                        h, m, s, now_s, access_token_expiry)
                 return True
             else:
                 self.log.info('Access Token expired!')
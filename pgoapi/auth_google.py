@@ -25,8 +25,10 @@ Author: tjado <https://github.com/tejado>
 
 from __future__ import absolute_import
 
+import time
 import logging
 
+from pgoapi import metrics
 from pgoapi.auth import Auth
 from pgoapi.exceptions import AuthException, InvalidCredentialsException, AuthGoogleTwoFactorRequiredException
 from gpsoauth import perform_master_login, perform_oauth
@@ -52,6 +54,7 @@ class AuthGoogle(Auth):
 
     def user_login(self, username, password):
         self.log.info('Google User Login for: {}'.format(username))
+        self._username = username
 
         if not isinstance(username, string_types) or not isinstance(
                 password, string_types):
@@ -87,7 +90,7 @@ class AuthGoogle(Auth):
         self.log.info('Google Refresh Token provided by user')
         self._refresh_token = refresh_token
 
-    def get_access_token(self, force_refresh=False):
+    def get_access_token(self, force_refresh=False, deadline=None):
         token_validity = self.check_access_token()
 
         if token_validity is True and force_refresh is False:
@@ -99,26 +102,41 @@ class AuthGoogle(Auth):
             else:
                 self.log.info('Request Google Access Token...')
 
-            token_data = perform_oauth(
-                None,
-                self._refresh_token,
-                self.GOOGLE_LOGIN_ANDROID_ID,
-                self.GOOGLE_LOGIN_SERVICE,
-                self.GOOGLE_LOGIN_APP,
-                self.GOOGLE_LOGIN_CLIENT_SIG,
-                proxy=self._proxy)
-
-            access_token = token_data.get('Auth', None)
-            if access_token is not None:
-                self._access_token = access_token
-                self._access_token_expiry = int(token_data.get('Expiry', 0))
-                self._login = True
-
-                self.log.info('Google Access Token successfully received.')
-                self.log.debug('Google Access Token: %s...',
-                               self._access_token[:25])
+            token = self._fetch_access_token(deadline)
+            if token is not None:
+                self._set_access_token(*token)
+                if deadline is not None:
+                    deadline.check()
                 return self._access_token
             else:
-                self._access_token = None
-                self._login = False
+                self._set_access_token(None, 0)
                 raise AuthException("Could not receive a Google Access Token")
+
+    def _fetch_access_token(self, deadline=None):
+        if self._refresh_token is None:
+            return None
+
+        # gpsoauth has no timeout support, the deadline is checked before
+        # and after the request, a late token is kept for the next call
+        if deadline is not None:
+            deadline.check()
+
+        start = time.time()
+        token_data = perform_oauth(
+            None,
+            self._refresh_token,
+            self.GOOGLE_LOGIN_ANDROID_ID,
+            self.GOOGLE_LOGIN_SERVICE,
+            self.GOOGLE_LOGIN_APP,
+            self.GOOGLE_LOGIN_CLIENT_SIG,
+            proxy=self._proxy)
+        metrics.AUTH_REFRESH_SECONDS.labels('google').observe(time.time() -
+                                                              start)
+
+        access_token = token_data.get('Auth', None)
+        if access_token is None:
+            return None
+
+        self.log.info('Google Access Token successfully received.')
+        self.log.debug('Google Access Token: %s...', access_token[:25])
+        return (access_token, int(token_data.get('Expiry', 0)))
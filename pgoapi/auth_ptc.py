@@ -27,13 +27,15 @@ from __future__ import absolute_import
 from future.standard_library import install_aliases
 install_aliases()
 
+import time
 import requests
 
 from urllib.parse import parse_qs, urlsplit
 from six import string_types
 
+from pgoapi import metrics
 from pgoapi.auth import Auth
-from pgoapi.utilities import get_time
+from pgoapi.utilities import get_request_timeout, get_time, send_request
 from pgoapi.exceptions import AuthException, AuthTimeoutException, InvalidCredentialsException
 
 from requests.exceptions import RequestException, Timeout
@@ -52,13 +54,16 @@ class AuthPtc(Auth):
                  password=None,
                  user_agent=None,
                  timeout=None,
-                 locale=None):
+                 locale=None,
+                 connect_timeout=None,
+                 adapter=None):
         Auth.__init__(self)
 
         self._auth_provider = 'ptc'
         self._username = username
         self._password = password
         self.timeout = timeout or 15
+        self.connect_timeout = connect_timeout or self.timeout
         self.locale = locale or 'en_US'
         self.user_agent = user_agent or 'pokemongo/1 CFNetwork/811.5.4 Darwin/16.7.0'
 
@@ -74,17 +79,46 @@ class AuthPtc(Auth):
             'X-Unity-Version': '5.5.1f1'
         }
 
+        # A shared adapter shares its connection pool between accounts,
+        # cookies stay separate as they belong to the session.
+        if adapter is not None:
+            self._session.mount('https://', adapter)
+
     def set_proxy(self, proxy_config):
         self._session.proxies = proxy_config
 
-    def user_login(self, username=None, password=None, retry=True):
+    def _get_timeout(self, deadline=None):
+        return get_request_timeout(self.connect_timeout, self.timeout,
+                                   deadline)
+
+    def user_login(self, username=None, password=None, retry=True,
+                   deadline=None):
         self._username = username or self._username
         self._password = password or self._password
-        if not isinstance(self._username, string_types) or not isinstance(
-                self._password, string_types):
+        if not self._has_credentials():
             raise InvalidCredentialsException(
                 "Username/password not correctly specified")
 
+        token = self._login_with_credentials(deadline)
+        if token is not None:
+            self._set_access_token(*token)
+            self.log.info('PTC User Login successful.')
+        elif self._refresh_token and retry:
+            self.get_access_token(deadline=deadline)
+        else:
+            self._set_access_token(None, 0)
+            raise AuthException("Could not retrieve a PTC Access Token")
+        return self._login
+
+    def _has_credentials(self):
+        return isinstance(self._username, string_types) and isinstance(
+            self._password, string_types)
+
+    def _login_with_credentials(self, deadline=None):
+        """
+        Logs in with username and password. Returns (access_token, expiry),
+        or None if only a new refresh token was issued.
+        """
         self.log.info('PTC User Login for: {}'.format(self._username))
         self._session.cookies.clear()
         now = get_time()
@@ -96,10 +130,13 @@ class AuthPtc(Auth):
         }
 
         try:
-            r = self._session.get(
+            r = send_request(
+                self._session,
+                'GET',
                 self.PTC_LOGIN_URL1_GET,
-                params=get_params,
-                timeout=self.timeout)
+                self._get_timeout(deadline),
+                deadline,
+                params=get_params)
         except Timeout:
             raise AuthTimeoutException('Auth GET timed out.')
         except RequestException as e:
@@ -126,12 +163,15 @@ class AuthPtc(Auth):
         post_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
 
         try:
-            r = self._session.post(
+            r = send_request(
+                self._session,
+                'POST',
                 self.PTC_LOGIN_URL2_POST,
+                self._get_timeout(deadline),
+                deadline,
                 data=data,
                 params=post_params,
                 headers=post_headers,
-                timeout=self.timeout,
                 allow_redirects=False)
         except Timeout:
             raise AuthTimeoutException('Auth POST timed out.')
@@ -147,23 +187,25 @@ class AuthPtc(Auth):
         # We don't consume the response, so explicitly release connection.
         r.close()
 
-        self._access_token = self._session.cookies.get('CASTGC')
-        if self._access_token:
-            self._login = True
-            self._access_token_expiry = int(now) + 7200
-            self.log.info('PTC User Login successful.')
-        elif self._refresh_token and retry:
-            self.get_access_token()
-        else:
-            self._login = False
-            raise AuthException("Could not retrieve a PTC Access Token")
-        return self._login
+        access_token = self._session.cookies.get('CASTGC')
+        if access_token:
+            return (access_token, int(now) + 7200)
+        return None
+
+    def get_state(self):
+        state = Auth.get_state(self)
+        state['username'] = self._username
+        return state
+
+    def set_state(self, state):
+        Auth.set_state(self, state)
+        self._username = state.get('username') or self._username
 
     def set_refresh_token(self, refresh_token):
         self.log.info('PTC Refresh Token provided by user')
         self._refresh_token = refresh_token
 
-    def get_access_token(self, force_refresh=False):
+    def get_access_token(self, force_refresh=False, deadline=None):
         token_validity = self.check_access_token()
 
         if token_validity is True and force_refresh is False:
@@ -175,80 +217,104 @@ class AuthPtc(Auth):
             else:
                 self.log.info('Request PTC Access Token...')
 
-            data = {
-                'client_id': 'mobile-app_pokemon-go',
-                'redirect_uri': 'https://www.nianticlabs.com/pokemongo/error',
-                'client_secret': self.PTC_LOGIN_CLIENT_SECRET,
-                'grant_type': 'refresh_token',
-                'code': self._refresh_token,
-            }
-
-            post_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-
-            try:
-                r = self._session.post(
-                    self.PTC_LOGIN_OAUTH,
-                    data=data,
-                    headers=post_headers,
-                    timeout=self.timeout)
-            except Timeout:
-                raise AuthTimeoutException('Auth POST timed out.')
-            except RequestException as e:
-                raise AuthException('Caught RequestException: {}'.format(e))
-
-            # Consumes response, so connection is released to pool.
-            token_data = parse_qs(r.text)
-
-            access_token = token_data.get('access_token')
-            if access_token is not None:
-                self._access_token = access_token[0]
-
-                # Set expiration to an hour less than value received because Pokemon OAuth
-                # login servers return an access token with an explicit expiry time of
-                # three hours, however, the token stops being valid after two hours.
-                # See issue #86.
-                expires = int(token_data.get('expires', [0])[0]) - 3600
-                if expires > 0:
-                    self._access_token_expiry = expires + get_time()
-                else:
-                    self._access_token_expiry = 0
-
-                self._login = True
-
-                self.log.info('PTC Access Token successfully retrieved.')
-                self.log.debug(
-                    'PTC Access Token: {}'.format(self._access_token))
-
-                # Last request is a profile request.
-                data = {
-                    'access_token': self._access_token,
-                    'client_id': 'mobile-app_pokemon-go',
-                    'locale': self.locale
-                }
-
-                post_headers = {
-                    'Content-Type': 'application/x-www-form-urlencoded'
-                }
-
-                try:
-                    r = self._session.post(
-                        self.PTC_LOGIN_PROFILE,
-                        data=data,
-                        headers=post_headers,
-                        timeout=self.timeout)
-
-                    # We don't consume the response, so explicitly release connection.
-                    r.close()
-                except Timeout:
-                    raise AuthTimeoutException('Auth profile POST timed out.')
-                except RequestException as e:
-                    raise AuthException('Caught RequestException: {}'.format(e))
+            token = self._exchange_refresh_token(deadline)
+            if token is not None:
+                self._set_access_token(*token)
+                return self._access_token
             else:
-                self._access_token = None
-                self._login = False
+                self._set_access_token(None, 0)
                 if force_refresh:
                     self.log.info(
                         'Reauthenticating with refresh token failed, using credentials instead.'
                     )
-                    return self.user_login(retry=False)
+                    return self.user_login(retry=False, deadline=deadline)
                 raise AuthException("Could not retrieve a PTC Access Token")
+
+    def _fetch_access_token(self, deadline=None):
+        # the refresh token is a one-time ticket and may be missing or used
+        # up, credentials get a new one like get_access_token(force_refresh)
+        token = None
+        if self._refresh_token:
+            token = self._exchange_refresh_token(deadline)
+        if token is None and self._has_credentials():
+            self.log.info('Renewing PTC Access Token with credentials.')
+            token = self._login_with_credentials(deadline)
+            if token is None and self._refresh_token:
+                token = self._exchange_refresh_token(deadline)
+        return token
+
+    def _exchange_refresh_token(self, deadline=None):
+        data = {
+            'client_id': 'mobile-app_pokemon-go',
+            'redirect_uri': 'https://www.nianticlabs.com/pokemongo/error',
+            'client_secret': self.PTC_LOGIN_CLIENT_SECRET,
+            'grant_type': 'refresh_token',
+            'code': self._refresh_token,
+        }
+
+        post_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        start = time.time()
+        try:
+            r = send_request(
+                self._session,
+                'POST',
+                self.PTC_LOGIN_OAUTH,
+                self._get_timeout(deadline),
+                deadline,
+                data=data,
+                headers=post_headers)
+        except Timeout:
+            raise AuthTimeoutException('Auth POST timed out.')
+        except RequestException as e:
+            raise AuthException('Caught RequestException: {}'.format(e))
+
+        # Consumes response, so connection is released to pool.
+        token_data = parse_qs(r.text)
+        metrics.AUTH_REFRESH_SECONDS.labels('ptc').observe(time.time() - start)
+
+        access_token = token_data.get('access_token')
+        if access_token is None:
+            return None
+        access_token = access_token[0]
+
+        # Set expiration to an hour less than value received because Pokemon OAuth
+        # login servers return an access token with an explicit expiry time of
+        # three hours, however, the token stops being valid after two hours.
+        # See issue #86.
+        expires = int(token_data.get('expires', [0])[0]) - 3600
+        if expires > 0:
+            expiry = expires + get_time()
+        else:
+            expiry = 0
+
+        self.log.info('PTC Access Token successfully retrieved.')
+        self.log.debug('PTC Access Token: {}'.format(access_token))
+
+        # Last request is a profile request.
+        data = {
+            'access_token': access_token,
+            'client_id': 'mobile-app_pokemon-go',
+            'locale': self.locale
+        }
+
+        post_headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        try:
+            r = send_request(
+                self._session,
+                'POST',
+                self.PTC_LOGIN_PROFILE,
+                self._get_timeout(deadline),
+                deadline,
+                data=data,
+                headers=post_headers)
+
+            # We don't consume the response, so explicitly release connection.
+            r.close()
+        except Timeout:
+            raise AuthTimeoutException('Auth profile POST timed out.')
+        except RequestException as e:
+            raise AuthException('Caught RequestException: {}'.format(e))
+
+        return (access_token, expiry)
@@ -0,0 +1,182 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import heapq
+import random
+import logging
+import threading
+
+from itertools import count
+
+log = logging.getLogger(__name__)
+
+
+class AuthRefresher:
+    """
+    Renews the access tokens of registered auth providers in the background,
+    refresh_before seconds (minus a random jitter) ahead of their expiry, so
+    check_access_token never has to refresh in the middle of a request.
+    Providers without a known expiry are looked at again every retry_delay
+    seconds. Failed refreshes are retried with a delay doubling up to
+    max_retry_delay, and not at all once the token expired: the next call
+    refreshes it in the foreground, where a failure is reported.
+    """
+
+    def __init__(self, workers=2, refresh_before=600, jitter=300,
+                 retry_delay=60, max_retry_delay=3600):
+        self.workers = workers
+        self.refresh_before = refresh_before
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._queue = []
+        self._generations = {}
+        self._failures = {}
+        self._counter = count()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name='AuthRefresher-{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def register(self, auth_provider):
+        with self._condition:
+            self._schedule(auth_provider)
+
+    def unregister(self, auth_provider):
+        with self._condition:
+            self._generations.pop(id(auth_provider), None)
+            self._failures.pop(id(auth_provider), None)
+
+    def pending(self):
+        with self._condition:
+            return len(self._generations)
+
+    def _schedule(self, auth_provider, due=None):
+        if due is None:
+            expiry = auth_provider.get_access_token_expiry()
+            if expiry:
+                due = expiry - self.refresh_before - random.uniform(
+                    0, self.jitter)
+            else:
+                due = time.time() + self.retry_delay
+
+        generation = next(self._counter)
+        self._generations[id(auth_provider)] = generation
+        heapq.heappush(self._queue, (due, generation, auth_provider))
+        self._condition.notify()
+
+    def _next(self):
+        with self._condition:
+            while self._running:
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+
+                due, generation, auth_provider = self._queue[0]
+                if self._generations.get(id(auth_provider)) != generation:
+                    # unregistered or rescheduled in the meantime
+                    heapq.heappop(self._queue)
+                    continue
+
+                delay = due - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._queue)
+                return auth_provider
+
+    def _work(self):
+        while True:
+            auth_provider = self._next()
+            if auth_provider is None:
+                return
+
+            # unknown expiry or already renewed by someone else
+            expiry = auth_provider.get_access_token_expiry()
+            now = time.time()
+            if not expiry or expiry - now > self.refresh_before + self.jitter:
+                with self._condition:
+                    self._failures.pop(id(auth_provider), None)
+                    if id(auth_provider) in self._generations:
+                        self._schedule(auth_provider)
+                continue
+
+            # left to the foreground, only check back whether it got renewed
+            if expiry <= now:
+                with self._condition:
+                    if id(auth_provider) in self._generations:
+                        self._schedule(auth_provider,
+                                       now + self.max_retry_delay)
+                continue
+
+            try:
+                log.debug('Renewing %s access token ahead of expiry',
+                          auth_provider.get_name())
+                # the current token stays in place if this fails, foreground
+                # calls keep using it until it actually expires
+                auth_provider.refresh_access_token()
+            except Exception as e:
+                with self._condition:
+                    failures = self._failures.get(id(auth_provider), 0) + 1
+                    delay = min(self.max_retry_delay,
+                                self.retry_delay * 2**(failures - 1))
+                    log.warning(
+                        'Background token refresh failed (%s), retrying in %ss: %s',
+                        failures, delay, e)
+                    if id(auth_provider) in self._generations:
+                        self._failures[id(auth_provider)] = failures
+                        self._schedule(auth_provider, time.time() + delay)
+                continue
+
+            with self._condition:
+                self._failures.pop(id(auth_provider), None)
+                if id(auth_provider) in self._generations:
+                    self._schedule(auth_provider)
@@ -0,0 +1,132 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import requests
+import threading
+
+from six.moves import queue
+
+from pgoapi.auth_ptc import AuthPtc
+from pgoapi.exceptions import AuthException
+
+log = logging.getLogger(__name__)
+
+
+class LoginResult:
+    def __init__(self, username, auth_provider=None, error=None, duration=0):
+        self.username = username
+        self.auth_provider = auth_provider
+        self.error = error
+        self.duration = duration
+
+    def is_success(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.error is None:
+            return '<LoginResult {} ok {:.2f}s>'.format(self.username,
+                                                       self.duration)
+        return '<LoginResult {} failed: {}>'.format(self.username, self.error)
+
+
+def bulk_ptc_login(accounts,
+                   workers=20,
+                   user_agent=None,
+                   timeout=None,
+                   locale=None,
+                   connect_timeout=None):
+    """
+    Logs in many PTC accounts concurrently on a pool of worker threads.
+
+    accounts is an iterable of (username, password) or (username, password,
+    proxy_config) tuples. All accounts share one connection pool to
+    sso.pokemon.com (unless they use a proxy), each keeps its own cookie jar.
+    A LoginResult is yielded for every account as soon as its login finished,
+    the authenticated AuthPtc can be handed to PGoApi.set_auth_provider.
+    """
+    accounts = list(accounts)
+    if not accounts:
+        return
+
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=workers, pool_block=True)
+
+    pending = queue.Queue()
+    for account in accounts:
+        pending.put(account)
+
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def login_worker():
+        while not stop.is_set():
+            try:
+                account = pending.get_nowait()
+            except queue.Empty:
+                return
+
+            # every account gets a result, even a malformed one
+            username = None
+            start = time.time()
+            try:
+                username, password = account[:2]
+                proxy_config = account[2] if len(account) > 2 else None
+
+                auth_provider = AuthPtc(
+                    user_agent=user_agent,
+                    timeout=timeout,
+                    locale=locale,
+                    connect_timeout=connect_timeout,
+                    adapter=None if proxy_config else adapter)
+                if proxy_config:
+                    auth_provider.set_proxy(proxy_config)
+
+                if not auth_provider.user_login(username, password):
+                    raise AuthException('User login failed!')
+                result = LoginResult(username, auth_provider,
+                                     duration=time.time() - start)
+            except Exception as e:
+                log.warning('PTC login for %s failed: %s', username, e)
+                result = LoginResult(username, error=e,
+                                     duration=time.time() - start)
+
+            results.put(result)
+
+    for i in range(min(workers, len(accounts))):
+        thread = threading.Thread(
+            target=login_worker, name='PtcLogin-{}'.format(i))
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for i in range(len(accounts)):
+            yield results.get()
+    finally:
+        # consumer stopped early, let the workers finish their current login
+        stop.set()
@@ -0,0 +1,260 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of one backend (the hashing server, a Niantic RPC
+    endpoint, ...) over a sliding time window. Once the error rate crosses
+    the threshold the breaker opens and requests fail fast until the
+    recovery timeout passed, then a limited number of trial requests are
+    let through (half-open) to decide whether to close it again. Trials
+    which report no result within half_open_timeout seconds are given up,
+    so a lost trial can't keep the breaker half-open forever.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 name,
+                 failure_rate=0.5,
+                 minimum_requests=10,
+                 window=30,
+                 recovery_timeout=30,
+                 half_open_requests=1,
+                 half_open_timeout=60):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.minimum_requests = minimum_requests
+        self.window = window
+        self.recovery_timeout = recovery_timeout
+        self.half_open_requests = half_open_requests
+        self.half_open_timeout = half_open_timeout
+
+        self._lock = threading.Lock()
+        self._results = deque()
+        self._state = self.CLOSED
+        self._opened_at = 0
+        self._trials = 0
+        self._trial_started = 0
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """ callback(breaker, old_state, new_state) is called on every state change """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self._listeners.remove(callback)
+
+    def get_state(self):
+        with self._lock:
+            self._check_recovery(time.time())
+            return self._state
+
+    def is_available(self):
+        """ Whether allow_request() would let a request through right now """
+        with self._lock:
+            now = time.time()
+            self._check_recovery(now)
+            if self._state == self.HALF_OPEN:
+                self._check_trials(now)
+                return self._trials < self.half_open_requests
+            return self._state == self.CLOSED
+
+    def retry_after(self):
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0
+            return max(0, self._opened_at + self.recovery_timeout - time.time())
+
+    def get_status(self):
+        with self._lock:
+            now = time.time()
+            self._check_recovery(now)
+            self._expire(now)
+            failures = sum(1 for _, ok in self._results if not ok)
+            retry_after = 0
+            if self._state == self.OPEN:
+                retry_after = max(
+                    0, self._opened_at + self.recovery_timeout - now)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'requests': len(self._results),
+                'failures': failures,
+                'retry_after': retry_after
+            }
+
+    def allow_request(self):
+        with self._lock:
+            now = time.time()
+            changed = self._check_recovery(now)
+            if self._state == self.CLOSED:
+                allowed = True
+            elif self._state == self.HALF_OPEN:
+                self._check_trials(now)
+                allowed = self._trials < self.half_open_requests
+                if allowed:
+                    self._trials += 1
+                    self._trial_started = now
+            else:
+                allowed = False
+        self._notify(changed)
+        return allowed
+
+    def record_success(self):
+        changed = None
+        with self._lock:
+            now = time.time()
+            if self._state == self.HALF_OPEN:
+                self._results.clear()
+                changed = self._set_state(self.CLOSED, now)
+            else:
+                self._results.append((now, True))
+                self._expire(now)
+        self._notify(changed)
+
+    def record_failure(self):
+        changed = None
+        with self._lock:
+            now = time.time()
+            if self._state == self.HALF_OPEN:
+                changed = self._set_state(self.OPEN, now)
+            else:
+                self._results.append((now, False))
+                self._expire(now)
+                total = len(self._results)
+                failures = sum(1 for _, ok in self._results if not ok)
+                if (self._state == self.CLOSED
+                        and total >= self.minimum_requests
+                        and failures >= total * self.failure_rate):
+                    changed = self._set_state(self.OPEN, now)
+        self._notify(changed)
+
+    def record_ignored(self):
+        """
+        The request says nothing about the backend, e.g. the caller's own
+        deadline ran out. A granted half-open trial is handed back.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+            changed = self._set_state(self.CLOSED, time.time())
+        self._notify(changed)
+
+    def _expire(self, now):
+        while self._results and self._results[0][0] < now - self.window:
+            self._results.popleft()
+
+    def _check_trials(self, now):
+        if self._trials and now >= self._trial_started + self.half_open_timeout:
+            log.info('Trial requests of %s got no result within %ss, retrying',
+                     self.name, self.half_open_timeout)
+            self._trials = 0
+
+    def _check_recovery(self, now):
+        if self._state == self.OPEN and now >= self._opened_at + self.recovery_timeout:
+            return self._set_state(self.HALF_OPEN, now)
+        return None
+
+    def _set_state(self, state, now):
+        old_state = self._state
+        if old_state == state:
+            return None
+
+        self._state = state
+        self._trials = 0
+        if state == self.OPEN:
+            self._opened_at = now
+            self._results.clear()
+        return (old_state, state)
+
+    def _notify(self, changed):
+        if not changed:
+            return
+
+        old_state, new_state = changed
+        if new_state == self.OPEN:
+            log.warning('Circuit breaker for %s opened - failing fast for %ss',
+                        self.name, self.recovery_timeout)
+        else:
+            log.info('Circuit breaker for %s changed from %s to %s',
+                     self.name, old_state, new_state)
+
+        for callback in list(self._listeners):
+            try:
+                callback(self, old_state, new_state)
+            except Exception as e:
+                log.warning('Circuit breaker listener failed: %s', e)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_breaker_defaults = {}
+
+
+def set_circuit_breaker_defaults(**kwargs):
+    """ Set the CircuitBreaker arguments used for breakers created afterwards """
+    _breaker_defaults.update(kwargs)
+
+
+def get_circuit_breaker(name, **kwargs):
+    """ Returns the process-wide breaker for a backend, creating it on first use """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                options = dict(_breaker_defaults)
+                options.update(kwargs)
+                breaker = CircuitBreaker(name, **options)
+                _breakers[name] = breaker
+    return breaker
+
+
+def get_circuit_breakers():
+    with _breakers_lock:
+        return list(_breakers.values())
+
+
+def get_circuit_breaker_states():
+    return dict((breaker.name, breaker.get_status())
+                for breaker in get_circuit_breakers())
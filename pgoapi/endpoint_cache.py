@@ -0,0 +1,148 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import logging
+import threading
+
+from pgoapi.utilities import replace_file
+
+log = logging.getLogger(__name__)
+
+
+class EndpointCache:
+    """
+    Remembers the API endpoint the server redirected to (status code 53)
+    per auth provider and region, so new sessions can skip the redirect
+    round trip. Entries expire after ttl seconds. If a path is given, the
+    cache is persisted as JSON and shared with other processes using the
+    same file.
+    """
+
+    def __init__(self, ttl=3600, path=None):
+        self.ttl = ttl
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._mtime = None
+
+        with self._lock:
+            self._load()
+
+    @staticmethod
+    def _key(provider, region=None):
+        return '{}|{}'.format(provider or '', region or '')
+
+    def get(self, provider, region=None):
+        key = self._key(provider, region)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            endpoint, timestamp = entry
+            if time.time() - timestamp > self.ttl:
+                del self._entries[key]
+                return None
+
+            return endpoint
+
+    def set(self, provider, region, endpoint):
+        key = self._key(provider, region)
+        with self._lock:
+            self._load()
+            self._entries[key] = (endpoint, time.time())
+            self._save()
+
+        log.debug('Cached API endpoint %s for %s', endpoint, key)
+
+    def invalidate(self, provider, region=None, endpoint=None):
+        """ Removes the entry, if endpoint is given only if it still points there """
+        key = self._key(provider, region)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None or (endpoint is not None and entry[0] != endpoint):
+                return False
+
+            del self._entries[key]
+            self._save()
+
+        log.info('Invalidated cached API endpoint %s for %s', entry[0], key)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def _load(self):
+        if not self.path or not os.path.isfile(self.path):
+            return
+
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path) as data:
+                entries = json.load(data)
+            self._entries = dict(
+                (key, tuple(entry)) for key, entry in entries.items())
+            self._mtime = mtime
+        except (IOError, OSError, ValueError) as e:
+            log.warning('Could not load endpoint cache %s: %s', self.path, e)
+
+    def _save(self):
+        if not self.path:
+            return
+
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as data:
+                json.dump(self._entries, data)
+            replace_file(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except (IOError, OSError) as e:
+            log.warning('Could not save endpoint cache %s: %s', self.path, e)
+
+
+_default_cache = None
+
+
+def set_default_endpoint_cache(cache):
+    """ Cache used by all PGoApi instances created afterwards """
+    global _default_cache
+    _default_cache = cache
+
+
+def get_default_endpoint_cache():
+    return _default_cache
@@ -36,6 +36,10 @@ class TimeoutException(PgoapiError):
     """Raised when a request times out."""
 
 
+class DeadlineExceededException(TimeoutException):
+    """Raised when a call runs out of its time budget."""
+
+
 class AuthException(PgoapiError):
     """Raised when logging in fails"""
 
@@ -86,6 +90,10 @@ class MalformedHashResponseException(MalformedResponseException,
     """Raised when the response from the hash server cannot be parsed."""
 
 
+class NoAvailableAccountException(PgoapiError):
+    """Raised when an account pool has no usable account to lease"""
+
+
 class NoPlayerPositionSetException(PgoapiError, ValueError):
     """Raised when either lat or lng is None"""
 
@@ -115,6 +123,24 @@ class HashingTimeoutException(HashingOfflineException, TimeoutException):
     """Raised when a request to the hashing server times out."""
 
 
+class CircuitBreakerOpenException(ServerBusyOrOfflineException):
+    """Raised when a circuit breaker is open and the request fails fast"""
+
+    def __init__(self, message=None, retry_after=0):
+        super(CircuitBreakerOpenException, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class NianticCircuitOpenException(CircuitBreakerOpenException,
+                                  NianticOfflineException):
+    """Raised when the circuit breaker of a Niantic endpoint is open"""
+
+
+class HashingCircuitOpenException(CircuitBreakerOpenException,
+                                  HashingOfflineException):
+    """Raised when the circuit breaker of the hashing server is open"""
+
+
 class NoHashKeyException(HashServerException):
     """Raised when a request is made without a hash key being provided"""
 
@@ -0,0 +1,325 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import json
+import logging
+
+from operator import attrgetter
+
+from pgoapi.inventory import iter_inventory_items
+
+from . import protos
+from pogoprotos.enums.pokemon_id_pb2 import PokemonId
+from pogoprotos.enums.pokemon_move_pb2 import PokemonMove
+from pogoprotos.networking.responses.get_inventory_response_pb2 import GetInventoryResponse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger(__name__)
+
+# cp multiplier of a level 40 pokemon
+MAX_CP_MULTIPLIER = 0.7903
+
+
+def _enum_label(name):
+    return name.replace('_FAST', '').replace('_', ' ').title()
+
+
+class GameData:
+    """
+    Pokemon and move lookup tables indexed by id, loaded once from the
+    pokemon.json / moves.json files of the examples or from the item
+    templates of a TemplateCache. Base stats, and with them the CP
+    calculations of PokemonStats, are only known from item templates.
+    """
+
+    def __init__(self,
+                 pokemon_names=None,
+                 move_names=None,
+                 base_stats=None,
+                 families=None):
+        self.pokemon_names = pokemon_names or {}
+        self.move_names = move_names or {}
+        # pokemon id -> (base attack, base defense, base stamina)
+        self.base_stats = base_stats or {}
+        # pokemon id -> family id
+        self.families = families or {}
+
+    @classmethod
+    def from_files(cls, pokemon_path, moves_path):
+        with open(pokemon_path) as data:
+            pokemon = json.load(data)
+        with open(moves_path) as data:
+            moves = json.load(data)
+
+        return cls(
+            dict((int(entry['Number']), entry['Name']) for entry in pokemon),
+            dict((int(entry['id']), entry['name']) for entry in moves))
+
+    @classmethod
+    def from_templates(cls, item_templates):
+        """ From an ItemTemplates view, names are derived from the enums """
+        pokemon_names = {}
+        base_stats = {}
+        families = {}
+        for pokemon_id, settings in item_templates.pokemon_settings.items():
+            pokemon_names[pokemon_id] = _enum_label(PokemonId.Name(pokemon_id))
+            base_stats[pokemon_id] = (settings.stats.base_attack,
+                                      settings.stats.base_defense,
+                                      settings.stats.base_stamina)
+            families[pokemon_id] = settings.family_id
+
+        move_names = dict(
+            (movement_id, _enum_label(PokemonMove.Name(movement_id)))
+            for movement_id in item_templates.move_settings)
+
+        return cls(pokemon_names, move_names, base_stats, families)
+
+    def get_pokemon_name(self, pokemon_id):
+        return self.pokemon_names.get(pokemon_id, str(pokemon_id))
+
+    def get_move_name(self, move_id):
+        return self.move_names.get(move_id, str(move_id))
+
+    def get_base_stats(self, pokemon_id):
+        return self.base_stats.get(pokemon_id)
+
+    def get_base_stats_table(self):
+        """ numpy array of (attack, defense, stamina) rows indexed by pokemon id """
+        table = np.zeros((max(self.base_stats or [0]) + 1, 3))
+        for pokemon_id, stats in self.base_stats.items():
+            table[pokemon_id] = stats
+        return table
+
+    def get_family_table(self):
+        """ numpy array of family ids indexed by pokemon id, 0 if unknown """
+        table = np.zeros(max(self.families or [0]) + 1, dtype=np.int32)
+        for pokemon_id, family_id in self.families.items():
+            table[pokemon_id] = family_id
+        return table
+
+
+class PokemonStats:
+    """
+    Columns of a whole inventory of pokemon as numpy arrays, for vectorized
+    IV, power quotient and CP calculations over thousands of pokemon.
+    pokemon are PokemonData messages or their dicts, e.g. from
+    iter_inventory_items(response, ['pokemon_data']). Requires numpy.
+    """
+
+    COLUMNS = ('pokemon_id', 'cp', 'individual_attack', 'individual_defense',
+               'individual_stamina', 'cp_multiplier',
+               'additional_cp_multiplier', 'move_1', 'move_2')
+
+    def __init__(self, pokemon=(), ids=None, rows=None):
+        if np is None:
+            raise ImportError('PokemonStats requires numpy.')
+
+        if ids is None:
+            ids = []
+            rows = []
+        for entry in pokemon:
+            if isinstance(entry, dict):
+                entry = entry.get('inventory_item_data', {}).get(
+                    'pokemon_data', entry)
+                ids.append(entry.get('id', 0))
+                rows.append([entry.get(column, 0) for column in self.COLUMNS])
+            else:
+                ids.append(entry.id)
+                rows.append([getattr(entry, column) for column in self.COLUMNS])
+
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(self.COLUMNS))
+
+        self.id = np.array(ids, dtype=np.uint64)
+        self.pokemon_id = data[:, 0].astype(np.int32)
+        self.cp = data[:, 1].astype(np.int32)
+        self.attack = data[:, 2].astype(np.int32)
+        self.defense = data[:, 3].astype(np.int32)
+        self.stamina = data[:, 4].astype(np.int32)
+        self.cp_multiplier = data[:, 5] + data[:, 6]
+        self.move_1 = data[:, 7].astype(np.int32)
+        self.move_2 = data[:, 8].astype(np.int32)
+
+    def __len__(self):
+        return len(self.id)
+
+    def get_iv_sum(self):
+        return self.attack + self.defense + self.stamina
+
+    def get_power_quotient(self):
+        """ IV perfection in percent """
+        return self.get_iv_sum() * (100.0 / 45)
+
+    def get_cp(self, game_data, cp_multiplier=None):
+        """
+        CP from base stats and IVs, at each pokemon's own level or at the
+        given cp multiplier, e.g. MAX_CP_MULTIPLIER for the level 40 CP.
+        """
+        base = game_data.get_base_stats_table()
+        known = self.pokemon_id < len(base)
+        stats = np.zeros((len(self), 3))
+        stats[known] = base[self.pokemon_id[known]]
+
+        if cp_multiplier is None:
+            cp_multiplier = self.cp_multiplier
+
+        cp = np.floor((stats[:, 0] + self.attack) *
+                      np.sqrt(stats[:, 1] + self.defense) *
+                      np.sqrt(stats[:, 2] + self.stamina) *
+                      np.square(cp_multiplier) / 10)
+        return np.maximum(cp, 10).astype(np.int32)
+
+    def rank(self, values=None):
+        """ Indices from the best to the worst, by power quotient by default """
+        if values is None:
+            values = self.get_power_quotient()
+        return np.argsort(-np.asarray(values), kind='mergesort')
+
+    def get_names(self, game_data, move_names=False):
+        """ Pokemon names per row, with move_names the names of both moves too """
+        names = [game_data.get_pokemon_name(i) for i in self.pokemon_id]
+        if not move_names:
+            return names
+        return (names, [game_data.get_move_name(i) for i in self.move_1],
+                [game_data.get_move_name(i) for i in self.move_2])
+
+
+class InventoryExport:
+    """
+    Collects the pokemon and candy of many accounts' GET_INVENTORY responses
+    into numpy columns for fleet wide reports, without building a dict per
+    item. Responses are GetInventoryResponse messages or serialized, the
+    latter only get the pokemon and candy entries parsed.
+
+        export = InventoryExport()
+        for name, response in responses:
+            export.add(name, response)
+        columns = export.get_columns(game_data)
+    """
+
+    def __init__(self):
+        if np is None:
+            raise ImportError('InventoryExport requires numpy.')
+
+        self.accounts = []
+        self._ids = []
+        self._rows = []
+        self._pokemon_accounts = []
+        self._candy = []
+
+    def add(self, account, response):
+        """ Adds the inventory of one account, returns the number of pokemon """
+        if isinstance(response, GetInventoryResponse):
+            items = response.inventory_delta.inventory_items
+        else:
+            items = iter_inventory_items(response, ['pokemon_data', 'candy'])
+
+        index = len(self.accounts)
+        self.accounts.append(account)
+        get_columns = attrgetter(*PokemonStats.COLUMNS)
+        count = 0
+
+        for item in items:
+            data = item.inventory_item_data
+            if data.HasField('pokemon_data'):
+                pokemon = data.pokemon_data
+                if pokemon.is_egg:
+                    continue
+                self._ids.append(pokemon.id)
+                self._rows.append(get_columns(pokemon))
+                count += 1
+            elif data.HasField('candy'):
+                self._candy.append(
+                    (index, data.candy.family_id, data.candy.candy))
+
+        self._pokemon_accounts.extend([index] * count)
+        return count
+
+    def get_pokemon(self):
+        """ PokemonStats of all pokemon, with their account index as .account """
+        stats = PokemonStats(ids=list(self._ids), rows=list(self._rows))
+        stats.account = np.array(self._pokemon_accounts, dtype=np.int32)
+        return stats
+
+    def get_candy(self):
+        """ account index, family_id and candy columns """
+        candy = np.array(self._candy, dtype=np.int64).reshape(-1, 3)
+        return {
+            'account': candy[:, 0].astype(np.int32),
+            'family_id': candy[:, 1].astype(np.int32),
+            'candy': candy[:, 2]
+        }
+
+    def get_columns(self, game_data=None):
+        """
+        Dict of equally long numpy arrays, one row per pokemon. With game
+        data from item templates the candy of the pokemon's family on its
+        account is included, else the candy column is 0.
+        """
+        stats = self.get_pokemon()
+        columns = {
+            'account': stats.account,
+            'id': stats.id,
+            'pokemon_id': stats.pokemon_id,
+            'cp': stats.cp,
+            'individual_attack': stats.attack,
+            'individual_defense': stats.defense,
+            'individual_stamina': stats.stamina,
+            'cp_multiplier': stats.cp_multiplier,
+            'move_1': stats.move_1,
+            'move_2': stats.move_2,
+            'power_quotient': stats.get_power_quotient(),
+            'family_id': np.zeros(len(stats), dtype=np.int32),
+            'candy': np.zeros(len(stats), dtype=np.int64)
+        }
+
+        if game_data is not None and game_data.families and len(stats):
+            families = game_data.get_family_table()
+            known = stats.pokemon_id < len(families)
+            family_id = columns['family_id']
+            family_id[known] = families[stats.pokemon_id[known]]
+
+            # candy looked up by (account, family) packed into one sortable key
+            candy = self.get_candy()
+            shift = np.int64(1 << 32)
+            candy_keys = candy['account'].astype(np.int64) * shift + candy['family_id']
+            order = np.argsort(candy_keys)
+            candy_keys = candy_keys[order]
+            candy_values = candy['candy'][order]
+
+            keys = stats.account.astype(np.int64) * shift + family_id
+            positions = np.searchsorted(candy_keys, keys)
+            positions = np.minimum(positions, max(len(candy_keys) - 1, 0))
+            if len(candy_keys):
+                found = candy_keys[positions] == keys
+                columns['candy'][found] = candy_values[positions[found]]
+
+        return columns
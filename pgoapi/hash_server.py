@@ -1,13 +1,17 @@
 from __future__ import absolute_import
 
+import time
 import ctypes
 import base64
 import requests
 
 from struct import pack, unpack
 
+from pgoapi import metrics
 from pgoapi.hash_engine import HashEngine
-from pgoapi.exceptions import BadHashRequestException, HashingOfflineException, HashingQuotaExceededException, HashingTimeoutException, MalformedHashResponseException, NoHashKeyException, TempHashingBanException, UnexpectedHashResponseException
+from pgoapi.circuit_breaker import get_circuit_breaker
+from pgoapi.utilities import get_request_timeout, send_request
+from pgoapi.exceptions import BadHashRequestException, DeadlineExceededException, HashingCircuitOpenException, HashingOfflineException, HashingQuotaExceededException, HashingTimeoutException, MalformedHashResponseException, NoHashKeyException, TempHashingBanException, UnexpectedHashResponseException
 
 
 class HashServer(HashEngine):
@@ -19,15 +23,25 @@ class HashServer(HashEngine):
     endpoint = 'https://pokehash.buddyauth.com/api/v153_2/hash'
     status = {}
 
-    def __init__(self, auth_token):
+    def __init__(self,
+                 auth_token,
+                 connect_timeout=30,
+                 read_timeout=30,
+                 deadline=None):
         if not auth_token:
             raise NoHashKeyException('Token not provided for hashing server.')
+        self.set_timeouts(connect_timeout, read_timeout, deadline)
         self.headers = {
             'content-type': 'application/json',
             'Accept': 'application/json',
             'X-AuthToken': auth_token
         }
 
+    def set_timeouts(self, connect_timeout, read_timeout, deadline=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+
     def hash(self, timestamp, latitude, longitude, accuracy, authticket,
              sessiondata, requestslist):
         self.location_hash = None
@@ -53,14 +67,54 @@ class HashServer(HashEngine):
             ]
         }
 
+        timeout = get_request_timeout(self.connect_timeout, self.read_timeout,
+                                      self.deadline)
+        # a timeout shortened by the caller's deadline says nothing about the server
+        full_timeout = timeout == (self.connect_timeout, self.read_timeout)
+
+        breaker = get_circuit_breaker('hash:' + self.endpoint)
+        if not breaker.allow_request():
+            raise HashingCircuitOpenException(
+                'Hashing server unavailable, circuit breaker is open.',
+                breaker.retry_after())
+
         # request hashes from hashing server
+        start = time.time()
         try:
-            response = self._session.post(
-                self.endpoint, json=payload, headers=self.headers, timeout=30)
+            response = send_request(
+                self._session,
+                'POST',
+                self.endpoint,
+                timeout,
+                self.deadline,
+                json=payload,
+                headers=self.headers)
+        except DeadlineExceededException:
+            breaker.record_ignored()
+            metrics.HASH_RESPONSES.labels('timeout').inc()
+            raise
         except requests.exceptions.Timeout:
+            if full_timeout:
+                breaker.record_failure()
+            else:
+                breaker.record_ignored()
+            metrics.HASH_RESPONSES.labels('timeout').inc()
             raise HashingTimeoutException('Hashing request timed out.')
         except requests.exceptions.ConnectionError as error:
+            breaker.record_failure()
+            metrics.HASH_RESPONSES.labels('error').inc()
             raise HashingOfflineException(error)
+        except Exception:
+            breaker.record_failure()
+            metrics.HASH_RESPONSES.labels('error').inc()
+            raise
+        metrics.HASH_SECONDS.observe(time.time() - start)
+        metrics.HASH_RESPONSES.labels(response.status_code).inc()
+
+        if response.status_code in (502, 503, 504):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
 
         if response.status_code == 400:
             raise BadHashRequestException(
@@ -0,0 +1,326 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import six
+import threading
+
+from collections import defaultdict
+
+from google.protobuf.message import DecodeError
+from protobuf_to_dict import protobuf_to_dict
+
+from . import protos
+from pogoprotos.inventory.inventory_item_pb2 import InventoryItem
+from pogoprotos.inventory.inventory_item_data_pb2 import InventoryItemData
+from pogoprotos.networking.responses.get_inventory_response_pb2 import GetInventoryResponse
+
+# field numbers of the path GetInventoryResponse.inventory_delta.inventory_items
+_INVENTORY_DELTA = GetInventoryResponse.DESCRIPTOR.fields_by_name[
+    'inventory_delta'].number
+_INVENTORY_ITEMS = GetInventoryResponse.DESCRIPTOR.fields_by_name[
+    'inventory_delta'].message_type.fields_by_name['inventory_items'].number
+_INVENTORY_ITEM_DATA = InventoryItem.DESCRIPTOR.fields_by_name[
+    'inventory_item_data'].number
+
+# 'pokemon_data', 'item', 'candy', ... -> field number in InventoryItemData
+INVENTORY_ITEM_TYPES = dict(
+    (field.name, field.number) for field in InventoryItemData.DESCRIPTOR.fields)
+
+_WIRETYPE_VARINT = 0
+_WIRETYPE_FIXED64 = 1
+_WIRETYPE_LENGTH_DELIMITED = 2
+_WIRETYPE_FIXED32 = 5
+
+
+def _read_varint(buf, pos):
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buf, pos, end):
+    """ Yields (field number, wire type, start, end) of the fields in buf[pos:end] """
+    try:
+        while pos < end:
+            key, pos = _read_varint(buf, pos)
+            wire_type = key & 7
+            start = pos
+            if wire_type == _WIRETYPE_LENGTH_DELIMITED:
+                length, start = _read_varint(buf, pos)
+                pos = start + length
+            elif wire_type == _WIRETYPE_VARINT:
+                _, pos = _read_varint(buf, pos)
+            elif wire_type == _WIRETYPE_FIXED64:
+                pos += 8
+            elif wire_type == _WIRETYPE_FIXED32:
+                pos += 4
+            else:
+                raise DecodeError('Unsupported wire type {}.'.format(wire_type))
+
+            if pos > end:
+                raise DecodeError('Truncated message.')
+            yield key >> 3, wire_type, start, pos
+    except IndexError:
+        raise DecodeError('Truncated message.')
+
+
+def _get_item_type(buf, start, end):
+    for number, wire_type, data_start, data_end in _iter_fields(
+            buf, start, end):
+        if number == _INVENTORY_ITEM_DATA and wire_type == _WIRETYPE_LENGTH_DELIMITED:
+            # the data is a oneof, its first field tells the type
+            for item_type, _, _, _ in _iter_fields(buf, data_start, data_end):
+                return item_type
+    return None
+
+
+def iter_inventory_items(response, item_types=None, use_dict=False):
+    """
+    Yields the InventoryItem messages of a serialized GET_INVENTORY response
+    one by one, without parsing the whole response first. item_types limits
+    them to the given InventoryItemData fields, e.g. ['pokemon_data'], all
+    other items are skipped on the wire level. Items are yielded as dicts
+    with use_dict=True.
+
+        request = api.create_request()
+        request.get_inventory(_raw_response=True)
+        response = request.call()['responses']['GET_INVENTORY']
+        for item in iter_inventory_items(response, ['pokemon_data']):
+            ...
+    """
+    numbers = None
+    if item_types is not None:
+        try:
+            numbers = set(INVENTORY_ITEM_TYPES[name] for name in item_types)
+        except KeyError as e:
+            raise ValueError('Unknown inventory item type: {}'.format(e))
+
+    buf = bytearray(response) if six.PY2 else response
+
+    for number, wire_type, start, end in _iter_fields(buf, 0, len(buf)):
+        if number != _INVENTORY_DELTA or wire_type != _WIRETYPE_LENGTH_DELIMITED:
+            continue
+
+        for number, wire_type, item_start, item_end in _iter_fields(
+                buf, start, end):
+            if number != _INVENTORY_ITEMS or wire_type != _WIRETYPE_LENGTH_DELIMITED:
+                continue
+            if numbers is not None and _get_item_type(
+                    buf, item_start, item_end) not in numbers:
+                continue
+
+            item = InventoryItem()
+            item.ParseFromString(bytes(response[item_start:item_end]))
+            yield protobuf_to_dict(item) if use_dict else item
+
+
+# InventoryItemData field -> field of it identifying the entry, as in InventoryKey
+_KEY_FIELDS = {
+    'pokemon_data': 'id',
+    'item': 'item_id',
+    'pokedex_entry': 'pokemon_id',
+    'candy': 'family_id',
+    'quest': 'quest_type',
+    'avatar_item': 'avatar_template_id'
+}
+
+
+def get_inventory_key(item):
+    """
+    Hashable (item type, id) key of an InventoryItem, following InventoryKey.
+    Single entries like player_stats have None as id.
+    """
+    if item.HasField('deleted_item'):
+        return ('pokemon_data', item.deleted_item.pokemon_id)
+
+    fields = item.inventory_item_data.ListFields()
+    if not fields:
+        return None
+
+    descriptor, data = fields[0]
+    key_field = _KEY_FIELDS.get(descriptor.name)
+    return (descriptor.name,
+            getattr(data, key_field) if key_field else None)
+
+
+class InventoryCache:
+    """
+    Inventory of one account, kept up to date from GET_INVENTORY deltas.
+
+    Once set on a PGoApi, every get_inventory() request is sent with the
+    last new_timestamp_ms the cache has seen, so the server only returns the
+    items changed since, and the response is applied to the cache. Items are
+    stored by their inventory key, with indexes for pokemon by species,
+    candy by family and item counts.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._timestamp_ms = 0
+            self._items = {}
+            self._species = defaultdict(set)
+            self._eggs = set()
+            self._candy = {}
+            self._item_counts = {}
+
+    def get_timestamp(self):
+        """ new_timestamp_ms of the last applied response, 0 before the first one """
+        with self._lock:
+            return self._timestamp_ms
+
+    def update(self, response, last_timestamp_ms=0):
+        """
+        Applies a GET_INVENTORY response, either serialized or as a
+        GetInventoryResponse message. last_timestamp_ms is the value the
+        request was sent with, 0 means the response is the full inventory.
+        """
+        if not isinstance(response, GetInventoryResponse):
+            message = GetInventoryResponse()
+            message.ParseFromString(response)
+            response = message
+
+        if not response.success:
+            return False
+
+        delta = response.inventory_delta
+        with self._lock:
+            if not last_timestamp_ms:
+                self.clear()
+
+            for item in delta.inventory_items:
+                key = get_inventory_key(item)
+                if key is None:
+                    continue
+                self._remove(key)
+                if not item.HasField('deleted_item'):
+                    # a copy, so the cache does not keep the whole response
+                    # alive or change with the caller's message
+                    stored = InventoryItem()
+                    stored.CopyFrom(item)
+                    self._add(key, stored)
+
+            self._timestamp_ms = max(self._timestamp_ms,
+                                     delta.new_timestamp_ms)
+        return True
+
+    def _add(self, key, item):
+        self._items[key] = item
+        item_type, item_id = key
+        data = item.inventory_item_data
+
+        if item_type == 'pokemon_data':
+            if data.pokemon_data.is_egg:
+                self._eggs.add(item_id)
+            else:
+                self._species[data.pokemon_data.pokemon_id].add(item_id)
+        elif item_type == 'candy':
+            self._candy[item_id] = data.candy.candy
+        elif item_type == 'item':
+            self._item_counts[item_id] = data.item.count
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+
+        item_type, item_id = key
+        if item_type == 'pokemon_data':
+            self._eggs.discard(item_id)
+            species = item.inventory_item_data.pokemon_data.pokemon_id
+            ids = self._species.get(species)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self._species[species]
+        elif item_type == 'candy':
+            self._candy.pop(item_id, None)
+        elif item_type == 'item':
+            self._item_counts.pop(item_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def get_item(self, item_type, item_id=None):
+        """ InventoryItem by key, e.g. get_item('player_stats') """
+        with self._lock:
+            return self._items.get((item_type, item_id))
+
+    def get_items(self, item_type=None):
+        with self._lock:
+            return [
+                item for key, item in self._items.items()
+                if item_type is None or key[0] == item_type
+            ]
+
+    def get_pokemon(self, pokemon_id):
+        """ PokemonData of the pokemon with this unique id """
+        item = self.get_item('pokemon_data', pokemon_id)
+        return item.inventory_item_data.pokemon_data if item else None
+
+    def get_pokemon_by_species(self, species):
+        with self._lock:
+            return [
+                self._items[('pokemon_data', pokemon_id)]
+                .inventory_item_data.pokemon_data
+                for pokemon_id in self._species.get(species, ())
+            ]
+
+    def get_species_counts(self):
+        with self._lock:
+            return dict((species, len(ids))
+                        for species, ids in self._species.items())
+
+    def get_eggs(self):
+        with self._lock:
+            return [
+                self._items[('pokemon_data', pokemon_id)]
+                .inventory_item_data.pokemon_data
+                for pokemon_id in self._eggs
+            ]
+
+    def get_candy(self, family_id):
+        with self._lock:
+            return self._candy.get(family_id, 0)
+
+    def get_item_count(self, item_id):
+        with self._lock:
+            return self._item_counts.get(item_id, 0)
+
+    def get_item_counts(self):
+        with self._lock:
+            return dict(self._item_counts)
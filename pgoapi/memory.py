@@ -0,0 +1,252 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import gc
+import os
+import sys
+import time
+import logging
+import threading
+
+from collections import defaultdict
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+log = logging.getLogger(__name__)
+
+# modules whose objects are counted by type
+DEFAULT_PREFIXES = ('pgoapi.', 'pogoprotos.', 'requests.', 'urllib3.')
+
+
+def get_rss():
+    """ Resident set size in bytes, the peak RSS where /proc is missing """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac os
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def get_object_counts(prefixes=DEFAULT_PREFIXES):
+    """ {'module.Class': instances} of all objects tracked by the gc """
+    counts = defaultdict(int)
+    for obj in gc.get_objects():
+        cls = getattr(obj, '__class__', type(obj))
+        module = getattr(cls, '__module__', None)
+        if (isinstance(module, str) and module.startswith(prefixes) and
+                module != __name__):
+            counts[module + '.' + cls.__name__] += 1
+    return dict(counts)
+
+
+def _format_size(size):
+    return '{:+.1f} MiB'.format(size / 1048576.0)
+
+
+class MemorySnapshot:
+    def __init__(self, prefixes=DEFAULT_PREFIXES):
+        gc.collect()
+        self.time = time.time()
+        self.rss = get_rss()
+        self.object_counts = get_object_counts(prefixes)
+        self.traces = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            self.traces = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<unknown>')))
+
+    def get_report(self, baseline, limit=20):
+        """ Text report of the growth since baseline, biggest first """
+        lines = ['Memory after {:.0f}s'.format(self.time - baseline.time)]
+        if self.rss is not None and baseline.rss is not None:
+            lines[0] += ': rss {:.1f} MiB ({})'.format(
+                self.rss / 1048576.0, _format_size(self.rss - baseline.rss))
+
+        growth = []
+        for name, count in self.object_counts.items():
+            diff = count - baseline.object_counts.get(name, 0)
+            if diff:
+                growth.append((diff, name, count))
+        growth.sort(reverse=True)
+        if growth:
+            lines.append('Objects:')
+            for diff, name, count in growth[:limit]:
+                lines.append('  {:+8d} {} ({})'.format(diff, name, count))
+
+        if self.traces is not None and baseline.traces is not None:
+            lines.append('Allocations:')
+            for stat in self.traces.compare_to(baseline.traces,
+                                               'lineno')[:limit]:
+                lines.append('  {}'.format(stat))
+
+        return '\n'.join(lines)
+
+
+class MemoryMonitor:
+    """
+    Memory diagnostics of a long running process: every interval seconds a
+    MemorySnapshot (RSS, per type object counts of pgoapi, protobuf and
+    requests objects and tracemalloc allocations per source line) is taken
+    and its growth since the first snapshot is logged. Allocations are only
+    traced on Python 3, frames is the traceback depth tracemalloc keeps.
+
+    Plain dicts, e.g. the output of protobuf_to_dict, are not counted by
+    type, they show up in the allocations of the line creating them.
+    """
+
+    def __init__(self,
+                 interval=300,
+                 frames=1,
+                 limit=20,
+                 prefixes=DEFAULT_PREFIXES,
+                 level=logging.INFO):
+        self.interval = interval
+        self.frames = frames
+        self.limit = limit
+        self.prefixes = tuple(prefixes)
+        self.level = level
+
+        self.baseline = None
+        self.last = None
+        self._started_tracing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+
+        self.baseline = self.last = MemorySnapshot(self.prefixes)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='MemoryMonitor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the monitor, returns the report of a final snapshot """
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+        report = self.take_snapshot()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return report
+
+    def take_snapshot(self):
+        """ Takes a snapshot now and returns its report """
+        self.last = MemorySnapshot(self.prefixes)
+        return self.get_report()
+
+    def get_report(self):
+        if self.baseline is None:
+            return None
+        return self.last.get_report(self.baseline, self.limit)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                log.log(self.level, self.take_snapshot())
+            except Exception as e:
+                log.warning('Memory snapshot failed: %s', e)
+
+
+_monitor = None
+_monitor_lock = threading.RLock()
+
+
+def start_memory_monitor(interval=300, **kwargs):
+    """
+    Starts memory diagnostics for the whole process, e.g. for a running
+    PGoApi or AccountPool, replacing a running monitor.
+    """
+    global _monitor
+    with _monitor_lock:
+        if _monitor is not None:
+            _monitor.stop()
+        _monitor = MemoryMonitor(interval, **kwargs)
+        _monitor.start()
+        return _monitor
+
+
+def stop_memory_monitor():
+    """ Stops the memory diagnostics, returns the final report """
+    global _monitor
+    with _monitor_lock:
+        monitor, _monitor = _monitor, None
+    if monitor is None:
+        return None
+    return monitor.stop()
+
+
+def get_memory_monitor():
+    return _monitor
+
+
+def toggle_memory_monitor(interval=300, **kwargs):
+    """ Starts or stops the memory diagnostics, logs the final report """
+    if _monitor is None:
+        start_memory_monitor(interval, **kwargs)
+        log.info('Memory diagnostics started.')
+    else:
+        log.info('Memory diagnostics stopped.\n%s', stop_memory_monitor())
+
+
+def install_signal_toggle(signum=None, interval=300, **kwargs):
+    """
+    Toggles the memory diagnostics of a live process with a signal, SIGUSR2
+    by default: kill -USR2 <pid>. Has to be called from the main thread.
+    """
+    import signal
+    if signum is None:
+        signum = signal.SIGUSR2
+    signal.signal(signum,
+                  lambda signum, frame: toggle_memory_monitor(interval, **kwargs))
@@ -0,0 +1,286 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import bisect
+import logging
+import threading
+
+from six.moves import BaseHTTPServer
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError('{} expects the labels {}'.format(
+                self.name, self.labelnames))
+
+        labelvalues = tuple(str(value) for value in labelvalues)
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues,
+                                                  self._create_child())
+        return child
+
+    def collect(self):
+        """ List of (label values, child) pairs """
+        with self._lock:
+            return sorted(self._children.items())
+
+    def reset(self):
+        with self._lock:
+            self._children = {}
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _create_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def get_snapshot(self):
+        """ (cumulative bucket counts incl. +Inf, sum, count) """
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = []
+        running = 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        _Metric.__init__(self, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _create_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    """
+    Pull style registry: metrics are updated in place and read on demand,
+    e.g. by a Prometheus scrape of start_metrics_server().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Metric {} already registered.'.format(
+                    metric.name))
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self.register(
+            Histogram(name, documentation, labelnames, buckets))
+
+    def get_metrics(self):
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def get_values(self):
+        """ {metric name: {label values: value or (buckets, sum, count)}} """
+        values = {}
+        for metric in self.get_metrics():
+            values[metric.name] = dict(
+                (labelvalues, child.get_snapshot()
+                 if metric.type == 'histogram' else child.value)
+                for labelvalues, child in metric.collect())
+        return values
+
+    def reset(self):
+        for metric in self.get_metrics():
+            metric.reset()
+
+    def to_prometheus_text(self):
+        lines = []
+        for metric in self.get_metrics():
+            lines.append('# HELP {} {}'.format(metric.name,
+                                               metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for labelvalues, child in metric.collect():
+                labels = list(zip(metric.labelnames, labelvalues))
+                if metric.type == 'counter':
+                    lines.append('{}{} {}'.format(metric.name,
+                                                  _format_labels(labels),
+                                                  _format_value(child.value)))
+                    continue
+
+                cumulative, total, count = child.get_snapshot()
+                bounds = [_format_value(b) for b in metric.buckets] + ['+Inf']
+                for bound, value in zip(bounds, cumulative):
+                    lines.append('{}_bucket{} {}'.format(
+                        metric.name, _format_labels(labels + [('le', bound)]),
+                        value))
+                lines.append('{}_sum{} {}'.format(
+                    metric.name, _format_labels(labels), _format_value(total)))
+                lines.append('{}_count{} {}'.format(
+                    metric.name, _format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        name,
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for name, value in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+ENVELOPE_BUILD_SECONDS = registry.histogram(
+    'pgoapi_envelope_build_seconds',
+    'Time to build, hash and sign a request envelope.')
+HASH_SECONDS = registry.histogram('pgoapi_hash_seconds',
+                                  'Latency of the hashing server.')
+HASH_RESPONSES = registry.counter('pgoapi_hash_responses_total',
+                                  'Hashing server responses by HTTP status.',
+                                  ['status'])
+RPC_SECONDS = registry.histogram(
+    'pgoapi_rpc_seconds',
+    'Latency of RPC requests by their first request type.', ['request_type'])
+RPC_RESPONSES = registry.counter(
+    'pgoapi_rpc_responses_total',
+    'RPC responses by HTTP status and envelope status code.',
+    ['http_status', 'status_code'])
+PARSE_SECONDS = registry.histogram('pgoapi_parse_seconds',
+                                   'Time to parse an RPC response.')
+BYTES_SENT = registry.counter('pgoapi_rpc_sent_bytes_total',
+                              'Bytes of RPC request envelopes sent.')
+BYTES_RECEIVED = registry.counter('pgoapi_rpc_received_bytes_total',
+                                  'Bytes of RPC responses received.')
+REDIRECTS = registry.counter('pgoapi_redirects_total',
+                             'API endpoint redirects (status code 53).')
+THROTTLES = registry.counter('pgoapi_throttles_total',
+                             'Throttled requests (status code 52).')
+AUTH_REFRESH_SECONDS = registry.histogram(
+    'pgoapi_auth_refresh_seconds',
+    'Time to get a new access token by provider.', ['provider'])
+
+
+def get_metrics_registry():
+    return registry
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    registry = registry
+
+    def do_GET(self):
+        body = self.registry.to_prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+def start_metrics_server(port=9464, address='127.0.0.1', registry=registry):
+    """
+    Serves the registry in the Prometheus text format on a daemon thread,
+    returns the server, stop it with shutdown().
+    """
+    class MetricsHandler(_MetricsHandler):
+        pass
+
+    MetricsHandler.registry = registry
+    server = BaseHTTPServer.HTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='pgoapi-metrics')
+    thread.daemon = True
+    thread.start()
+    log.info('Serving metrics on http://%s:%s/metrics', address, port)
+    return server
@@ -29,22 +29,49 @@ import time
 import random
 import logging
 import requests
+import threading
+
+from multiprocessing.pool import ThreadPool
 
 from . import __title__, __version__, __copyright__
 from pgoapi.rpc_api import RpcApi, RpcState
 from pgoapi.auth_ptc import AuthPtc
 from pgoapi.auth_google import AuthGoogle
-from pgoapi.utilities import parse_api_endpoint, get_time
-from pgoapi.exceptions import AuthException, AuthTokenExpiredException, BadRequestException, BannedAccountException, InvalidCredentialsException, NoPlayerPositionSetException, NotLoggedInException, ServerApiEndpointRedirectException, ServerBusyOrOfflineException, UnexpectedResponseException
+from pgoapi.utilities import Deadline, parse_api_endpoint, get_time
+from pgoapi.endpoint_cache import get_default_endpoint_cache
+from pgoapi.template_cache import ItemTemplates, get_default_template_cache
+from pgoapi.tracing import is_tracing_enabled, span
+from pgoapi.exceptions import AuthException, AuthTokenExpiredException, BadRequestException, BannedAccountException, CircuitBreakerOpenException, DeadlineExceededException, HashServerException, InvalidCredentialsException, NianticOfflineException, NianticThrottlingException, NoPlayerPositionSetException, NotLoggedInException, ServerApiEndpointRedirectException, ServerBusyOrOfflineException, TimeoutException, UnexpectedResponseException
+
+from protobuf_to_dict import protobuf_to_dict
 
 from . import protos
 from pogoprotos.networking.requests.request_type_pb2 import RequestType
+from pogoprotos.networking.responses.download_item_templates_response_pb2 import DownloadItemTemplatesResponse
+from pogoprotos.networking.responses.download_settings_response_pb2 import DownloadSettingsResponse
+from pogoprotos.networking.responses.get_inventory_response_pb2 import GetInventoryResponse
 from pogoprotos.networking.platform.platform_request_type_pb2 import PlatformRequestType
 
 logger = logging.getLogger(__name__)
 
+SESSION_VERSION = 1
+
+# restore_session() options of AuthPtc, Google logins don't use any of them
+PTC_AUTH_OPTIONS = ('user_agent', 'timeout', 'locale', 'connect_timeout',
+                    'adapter')
+
+DEFAULT_API_ENDPOINT = parse_api_endpoint('pgorelease.nianticlabs.com/plfe')
+
 
 class PGoApi:
+    """
+    One PGoApi instance can be shared by several threads, each building and
+    calling its own request object from create_request(). Request ids are
+    generated atomically, the position is stored as one tuple and snapshotted
+    when a request is created, and the session ticket is guarded by a lock on
+    the auth provider. Request objects themselves must not be shared.
+    """
+
     def __init__(self,
                  provider=None,
                  oauth2_refresh_token=None,
@@ -57,26 +84,38 @@ class PGoApi:
                  device_info=None):
         self.RPC_ID_LOW = 1
         self.RPC_ID_HIGH = 1
+        self._request_id_lock = threading.Lock()
         self.START_TIME = get_time(ms=True) - random.randint(6000, 10000)
 
         self.set_logger()
         self.log.info('%s v%s - %s', __title__, __version__, __copyright__)
 
         self._auth_provider = None
+        self._auth_refresher = None
         if provider is not None and (
             (username is not None and password is not None) or
             (oauth2_refresh_token is not None)):
             self.set_authentication(provider, oauth2_refresh_token, username,
                                     password, proxy_config)
 
-        self.set_api_endpoint('pgorelease.nianticlabs.com/plfe')
+        self.set_api_endpoint(DEFAULT_API_ENDPOINT)
+        self._endpoint_cache = get_default_endpoint_cache()
+        self._endpoint_region = None
+        self._api_endpoint_cached = False
 
-        self._position_lat = position_lat
-        self._position_lng = position_lng
-        self._position_alt = position_alt
+        self._position = (position_lat, position_lng, position_alt)
 
         self._hash_server_token = None
 
+        self._connect_timeout = 30
+        self._read_timeout = 30
+        self._call_timeout = None
+
+        self._rate_limiter = None
+        self._signature_encryptor = None
+        self._inventory_cache = None
+        self._template_cache = get_default_template_cache()
+
         self._session = requests.session()
 
         # requests' Session calls .default_headers() in init, which
@@ -110,9 +149,17 @@ class PGoApi:
                            proxy_config=None,
                            user_agent=None,
                            timeout=None,
-                           locale=None):
+                           locale=None,
+                           connect_timeout=None):
+        if self._auth_refresher is not None and self._auth_provider is not None:
+            self._auth_refresher.unregister(self._auth_provider)
+
         if provider == 'ptc':
-            self._auth_provider = AuthPtc(user_agent=user_agent, timeout=timeout, locale=locale)
+            self._auth_provider = AuthPtc(
+                user_agent=user_agent,
+                timeout=timeout,
+                locale=locale,
+                connect_timeout=connect_timeout)
         elif provider == 'google':
             self._auth_provider = AuthGoogle()
         elif provider is None:
@@ -136,53 +183,291 @@ class PGoApi:
                 "Invalid Credential Input - Please provide username/password or an oauth2 refresh token"
             )
 
+        if self._auth_refresher is not None:
+            self._auth_refresher.register(self._auth_provider)
+
+    def set_auth_provider(self, auth_provider):
+        """ Use an already authenticated provider, e.g. from bulk_ptc_login """
+        if self._auth_refresher is not None and self._auth_provider is not None:
+            self._auth_refresher.unregister(self._auth_provider)
+
+        self._auth_provider = auth_provider
+
+        if self._auth_refresher is not None and auth_provider is not None:
+            self._auth_refresher.register(auth_provider)
+
+    def set_auth_refresher(self, auth_refresher):
+        """ Let an AuthRefresher renew the access token in the background """
+        if self._auth_refresher is not None and self._auth_provider is not None:
+            self._auth_refresher.unregister(self._auth_provider)
+
+        self._auth_refresher = auth_refresher
+        if auth_refresher is not None and self._auth_provider is not None:
+            auth_refresher.register(self._auth_provider)
+
     def get_position(self):
-        return (self._position_lat, self._position_lng, self._position_alt)
+        return self._position
 
     def set_position(self, lat, lng, alt=None):
         self.log.debug('Set Position - Lat: %s Long: %s Alt: %s', lat, lng,
                        alt)
 
-        self._position_lat = lat
-        self._position_lng = lng
-        self._position_alt = alt
+        # replaced as a whole, so readers never see a torn position
+        self._position = (lat, lng, alt)
 
     def set_proxy(self, proxy_config):
         self._session.proxies = proxy_config
 
+    def set_timeouts(self,
+                     connect_timeout=None,
+                     read_timeout=None,
+                     call_timeout=None):
+        """
+        connect_timeout/read_timeout apply to every single HTTP request to the
+        hashing server and the RPC endpoint, call_timeout is the default time
+        budget of a whole call including auth refresh, hashing and redirects
+        """
+        if connect_timeout is not None:
+            self._connect_timeout = connect_timeout
+        if read_timeout is not None:
+            self._read_timeout = read_timeout
+        self._call_timeout = call_timeout
+
+    def get_timeouts(self):
+        return (self._connect_timeout, self._read_timeout, self._call_timeout)
+
+    def set_rate_limiter(self, rate_limiter):
+        """ Every call waits for the RateLimiter before its envelope is built """
+        self._rate_limiter = rate_limiter
+
+    def get_rate_limiter(self):
+        return self._rate_limiter
+
+    def set_inventory_cache(self, inventory_cache):
+        """ get_inventory() calls only fetch and apply deltas to the InventoryCache """
+        self._inventory_cache = inventory_cache
+
+    def get_inventory_cache(self):
+        return self._inventory_cache
+
+    def set_template_cache(self, template_cache):
+        """ TemplateCache consulted by app_simulation_login, None disables it """
+        self._template_cache = template_cache
+
+    def get_template_cache(self):
+        return self._template_cache
+
     def get_api_endpoint(self):
+        if self._api_endpoint == DEFAULT_API_ENDPOINT and self._endpoint_cache is not None:
+            cached_endpoint = self._endpoint_cache.get(
+                self._get_provider_name(), self._endpoint_region)
+            if cached_endpoint:
+                self.log.debug('Using cached API endpoint %s', cached_endpoint)
+                self._api_endpoint = cached_endpoint
+                self._api_endpoint_cached = True
         return self._api_endpoint
 
     def set_api_endpoint(self, api_url):
+        self._api_endpoint_cached = False
         if api_url.startswith("https"):
             self._api_endpoint = api_url
         else:
             self._api_endpoint = parse_api_endpoint(api_url)
 
+    def set_endpoint_cache(self, endpoint_cache, region=None):
+        self._endpoint_cache = endpoint_cache
+        self._endpoint_region = region
+
+    def cache_api_endpoint(self):
+        if self._endpoint_cache is not None and self._api_endpoint != DEFAULT_API_ENDPOINT:
+            self._endpoint_cache.set(self._get_provider_name(),
+                                     self._endpoint_region, self._api_endpoint)
+
+    def invalidate_api_endpoint(self, api_endpoint):
+        """ Drops a cached endpoint which failed, the next call starts over at the default one """
+        if (self._endpoint_cache is None or not self._api_endpoint_cached
+                or self._api_endpoint != api_endpoint):
+            return
+
+        self._endpoint_cache.invalidate(self._get_provider_name(),
+                                        self._endpoint_region, api_endpoint)
+        self._api_endpoint = DEFAULT_API_ENDPOINT
+        self._api_endpoint_cached = False
+
+    def _get_provider_name(self):
+        if self._auth_provider is None:
+            return None
+        return self._auth_provider.get_name()
+
     def get_auth_provider(self):
         return self._auth_provider
 
     def create_request(self):
-        request = PGoApiRequest(self, self._position_lat, self._position_lng,
-                                self._position_alt, self.device_info)
+        position_lat, position_lng, position_alt = self._position
+        request = PGoApiRequest(self, position_lat, position_lng,
+                                position_alt, self.device_info)
         return request
 
+    def pipeline(self, api_requests, use_dict=True, timeout=None):
+        """
+        Calls the request objects from the iterable api_requests in order and yields
+        their responses. While one call is in flight the next request is
+        already built, hashed and signed on a background thread, which hides
+        the hashing round trip for back to back calls like a scanner's
+        GET_MAP_OBJECTS. A failed preparation is retried by call() itself.
+
+        With a rate limiter nothing is prepared ahead: the limiter has to
+        let a request through before its envelope is built, and a request
+        waiting for its turn would carry stale signature timestamps.
+        """
+        api_requests = iter(api_requests)
+        pool = ThreadPool(1)
+        try:
+            current = next(api_requests, None)
+            pending = None
+            if current is not None and self.get_rate_limiter() is None:
+                pending = pool.apply_async(current.prepare, (timeout, ))
+
+            while current is not None:
+                if pending is not None:
+                    try:
+                        pending.get()
+                    except Exception as e:
+                        self.log.debug('Preparing request failed: %s', e)
+
+                following = next(api_requests, None)
+                pending = None
+                if following is not None and self.get_rate_limiter() is None:
+                    pending = pool.apply_async(following.prepare, (timeout, ))
+
+                yield current.call(use_dict, timeout)
+                current = following
+        finally:
+            pool.close()
+
     def activate_hash_server(self, hash_server_token):
         self._hash_server_token = hash_server_token
 
     def get_hash_server_token(self):
         return self._hash_server_token
 
+    def set_signature_encryptor(self, encryptor):
+        """ e.g. a PoolSignatureEncryptor shared by all accounts, None for the default """
+        self._signature_encryptor = encryptor
+
+    def get_signature_encryptor(self):
+        return self._signature_encryptor
+
     def get_next_request_id(self):
-        self.RPC_ID_LOW += 1
-        self.RPC_ID_HIGH = ((7**5) * self.RPC_ID_HIGH) % ((2**31) - 1)
-        reqid = (self.RPC_ID_HIGH << 32) | self.RPC_ID_LOW
+        with self._request_id_lock:
+            self.RPC_ID_LOW += 1
+            self.RPC_ID_HIGH = ((7**5) * self.RPC_ID_HIGH) % ((2**31) - 1)
+            reqid = (self.RPC_ID_HIGH << 32) | self.RPC_ID_LOW
         self.log.debug('RPC Request ID: %s.', reqid)
         return reqid
 
     def get_start_time(self):
         return self.START_TIME
 
+    def get_session(self):
+        """
+        Returns a JSON serializable snapshot of the session (auth tokens, session
+        ticket, API endpoint, RPC state and request id counters). Passwords are
+        never part of it.
+        """
+        auth_state = None
+        if self._auth_provider is not None:
+            auth_state = self._auth_provider.get_state()
+
+        with self._request_id_lock:
+            rpc_id_low, rpc_id_high = self.RPC_ID_LOW, self.RPC_ID_HIGH
+
+        return {
+            'version': SESSION_VERSION,
+            'auth': auth_state,
+            'api_endpoint': self._api_endpoint,
+            'rpc_id_low': rpc_id_low,
+            'rpc_id_high': rpc_id_high,
+            'start_time': self.START_TIME,
+            'state': self.state.get_state()
+        }
+
+    def restore_session(self,
+                        session,
+                        password=None,
+                        proxy_config=None,
+                        auth_provider=None,
+                        **auth_options):
+        """
+        Restores a get_session() snapshot. The auth provider is created again
+        with password and auth_options (PTC_AUTH_OPTIONS, only applied to ptc
+        accounts), or auth_provider is used as it is configured, e.g. an
+        AuthPtc sharing an adapter with other accounts.
+        """
+        if session.get('version') != SESSION_VERSION:
+            raise ValueError('Unsupported session version: {}'.format(
+                session.get('version')))
+
+        unknown = set(auth_options) - set(PTC_AUTH_OPTIONS)
+        if unknown:
+            raise TypeError('Unknown auth options: {}'.format(', '.join(
+                sorted(unknown))))
+
+        auth_state = session.get('auth')
+        if auth_state:
+            if self._auth_refresher is not None and self._auth_provider is not None:
+                self._auth_refresher.unregister(self._auth_provider)
+
+            provider = auth_state.get('provider')
+            if auth_provider is not None:
+                if auth_provider.get_name() != provider:
+                    raise InvalidCredentialsException(
+                        'Session is for a {} account, got a {} auth provider.'.
+                        format(provider, auth_provider.get_name()))
+                self._auth_provider = auth_provider
+            elif provider == 'ptc':
+                self._auth_provider = AuthPtc(
+                    password=password, **auth_options)
+            elif provider == 'google':
+                self._auth_provider = AuthGoogle()
+            else:
+                raise InvalidCredentialsException(
+                    "Invalid authentication provider - only ptc/google available.")
+
+            if proxy_config:
+                self._auth_provider.set_proxy(proxy_config)
+            self._auth_provider.set_state(auth_state)
+
+            if self._auth_refresher is not None:
+                self._auth_refresher.register(self._auth_provider)
+
+        self.set_api_endpoint(session['api_endpoint'])
+        with self._request_id_lock:
+            self.RPC_ID_LOW = session['rpc_id_low']
+            self.RPC_ID_HIGH = session['rpc_id_high']
+        self.START_TIME = session['start_time']
+        self.state.set_state(session['state'])
+
+        self.log.info('Restored session (endpoint %s)', self._api_endpoint)
+
+    def save_session(self, store, key):
+        store.save(key, self.get_session())
+
+    def load_session(self,
+                     store,
+                     key,
+                     password=None,
+                     proxy_config=None,
+                     auth_provider=None,
+                     **auth_options):
+        session = store.load(key)
+        if not session:
+            return False
+
+        self.restore_session(session, password, proxy_config, auth_provider,
+                             **auth_options)
+        return True
+
     def __getattr__(self, func):
         def function(**kwargs):
             request = self.create_request()
@@ -218,6 +503,14 @@ class PGoApi:
 
         time.sleep(1.5)
 
+        template_cache = self._template_cache
+        settings = {}
+        if template_cache is not None:
+            settings['_raw_response'] = True
+            settings_hash = template_cache.get_settings_hash()
+            if settings_hash:
+                settings['hash'] = settings_hash
+
         request = self.create_request()
         request.download_remote_config_version(
             platform=1, app_version=self.get_api_version())
@@ -225,13 +518,105 @@ class PGoApi:
         request.get_hatched_eggs()
         request.get_inventory()
         request.check_awarded_badges()
-        request.download_settings()
+        request.download_settings(**settings)
         response = request.call()
 
+        if template_cache is not None:
+            self._update_template_cache(template_cache, response)
+
         self.log.info('Finished RPC login sequence (iOS app simulation)')
 
         return response
 
+    def _update_template_cache(self, template_cache, response):
+        responses = response.get('responses', {})
+
+        settings = responses.get('DOWNLOAD_SETTINGS')
+        if isinstance(settings, bytes):
+            message = DownloadSettingsResponse()
+            message.ParseFromString(settings)
+            template_cache.update_settings(message)
+            responses['DOWNLOAD_SETTINGS'] = protobuf_to_dict(message)
+
+        remote_config = responses.get('DOWNLOAD_REMOTE_CONFIG_VERSION')
+        if not isinstance(remote_config, dict):
+            return
+
+        timestamp_ms = remote_config.get('item_templates_timestamp_ms', 0)
+        if timestamp_ms and not template_cache.is_templates_current(
+                timestamp_ms):
+            # only the first of the accounts logging in at once downloads
+            with template_cache.get_refresh_lock():
+                if template_cache.is_templates_current(timestamp_ms):
+                    return
+                self.log.info('Item templates outdated, downloading them')
+                time.sleep(1.5)
+                self.update_item_templates(timestamp_ms)
+
+    def update_item_templates(self, timestamp_ms=0, retries=3):
+        """
+        Downloads all pages of the item templates, stores them in the template
+        cache for the given item_templates_timestamp_ms and returns the
+        ItemTemplates view.
+        """
+        template_cache = self._template_cache
+        if template_cache is None:
+            return self._download_item_templates(timestamp_ms, retries)
+
+        with template_cache.get_refresh_lock():
+            if timestamp_ms and template_cache.is_templates_current(
+                    timestamp_ms):
+                return template_cache.get_templates()
+            return self._download_item_templates(timestamp_ms, retries)
+
+    def _download_item_templates(self, timestamp_ms, retries):
+        item_templates = []
+        page_offset = 0
+        page_timestamp = 0
+        attempts = 0
+
+        while True:
+            request = self.create_request()
+            request.download_item_templates(
+                paginate=True,
+                page_offset=page_offset,
+                page_timestamp=page_timestamp)
+            response = request.call(use_dict=False)['responses'].get(
+                'DOWNLOAD_ITEM_TEMPLATES')
+            if not isinstance(response, DownloadItemTemplatesResponse):
+                raise UnexpectedResponseException(
+                    'Invalid DOWNLOAD_ITEM_TEMPLATES response.')
+
+            if response.result == DownloadItemTemplatesResponse.RETRY:
+                attempts += 1
+                if attempts > retries:
+                    raise UnexpectedResponseException(
+                        'Item template download kept asking for a retry.')
+                time.sleep(1.5)
+                continue
+            elif response.result not in (DownloadItemTemplatesResponse.PAGE,
+                                         DownloadItemTemplatesResponse.SUCCESS):
+                raise UnexpectedResponseException(
+                    'Item template download failed with result {}.'.format(
+                        response.result))
+
+            item_templates.extend(response.item_templates)
+            if response.result == DownloadItemTemplatesResponse.SUCCESS or not response.page_offset:
+                break
+
+            page_offset = response.page_offset
+            page_timestamp = response.timestamp_ms
+
+        timestamp_ms = timestamp_ms or response.timestamp_ms
+        if self._template_cache is not None:
+            self._template_cache.set_templates(item_templates, timestamp_ms)
+            return self._template_cache.get_templates()
+
+        response = DownloadItemTemplatesResponse()
+        response.timestamp_ms = timestamp_ms
+        response.item_templates.extend(item_templates)
+        return ItemTemplates(response)
+
     """
     The login function is not needed anymore but still in the code for backward compatibility"
     """
@@ -245,11 +630,12 @@ class PGoApi:
               alt=None,
               app_simulation=True):
 
+        position_lat, position_lng, position_alt = self._position
         if lat and lng:
-            self._position_lat = lat
-            self._position_lng = lng
+            position_lat, position_lng = lat, lng
         if alt:
-            self._position_alt = alt
+            position_alt = alt
+        self._position = (position_lat, position_lng, position_alt)
 
         try:
             self.set_authentication(
@@ -295,9 +681,24 @@ class PGoApiRequest:
 
         self._req_method_list = []
         self._req_platform_list = []
+        self._raw_responses = set()
+        self._prepared = None
+        self._request_id = None
         self.device_info = device_info
 
-    def call(self, use_dict=True):
+    def call(self, use_dict=True, timeout=None):
+        with span('pgoapi.call') as call_span:
+            if is_tracing_enabled():
+                call_span.set_attribute('request_types', [
+                    RequestType.Name(t) for t, _ in self._req_method_list
+                ])
+                call_span.set_attribute('endpoint', self._api_endpoint)
+                if self._auth_provider is not None:
+                    call_span.set_attribute(
+                        'account', self._auth_provider.get_username())
+            return self._call(use_dict, timeout, call_span)
+
+    def _call(self, use_dict, timeout, call_span):
         if (self._position_lat is None) or (self._position_lng is None):
             raise NoPlayerPositionSetException
 
@@ -306,24 +707,48 @@ class PGoApiRequest:
             raise NotLoggedInException
 
         api = self.__parent__
-        request = RpcApi(self._auth_provider, self.device_info, self.state,
-                         api.get_next_request_id(), api.get_start_time())
-        request._session = api._session
-
-        hash_server_token = api.get_hash_server_token()
-        request.activate_hash_server(hash_server_token)
+        connect_timeout, read_timeout, call_timeout = api.get_timeouts()
+        deadline = Deadline(timeout if timeout is not None else call_timeout)
+
+        rate_limiter = api.get_rate_limiter()
+        if rate_limiter is not None:
+            with span('rate_limit'):
+                rate_limiter.acquire(
+                    [RequestType.Name(t) for t, _ in self._req_method_list],
+                    deadline)
+
+        request = self._prepared
+        self._prepared = None
+        if request is None:
+            request = self._create_rpc(deadline)
+        else:
+            request.set_timeouts(connect_timeout, read_timeout, deadline)
+
+        # with an inventory cache GET_INVENTORY is applied to it from the raw response
+        inventory_cache = api.get_inventory_cache()
+        inventory_request = None
+        raw_responses = self._raw_responses
+        if inventory_cache is not None:
+            for entry_id, arguments in self._req_method_list:
+                if entry_id == RequestType.Value('GET_INVENTORY'):
+                    inventory_request = arguments or {}
+                    raw_responses = raw_responses | set([entry_id])
 
         response = None
         execute = True
+        attempts = 0
 
         while execute:
             execute = False
+            attempts += 1
+            call_span.set_attribute('attempts', attempts)
 
             try:
                 response = request.request(self._api_endpoint,
                                            self._req_method_list,
                                            self._req_platform_list,
-                                           self.get_position(), use_dict)
+                                           self.get_position(), use_dict,
+                                           raw_responses)
             except AuthTokenExpiredException as e:
                 """
                 This exception only occures if the OAUTH service provider (google/ptc) didn't send any expiration date
@@ -332,7 +757,11 @@ class PGoApiRequest:
                 try:
                     self.log.info(
                         'Access Token rejected! Requesting new one...')
-                    self._auth_provider.get_access_token(force_refresh=True)
+                    with span('auth_refresh'):
+                        self._auth_provider.get_access_token(
+                            force_refresh=True, deadline=deadline)
+                except DeadlineExceededException:
+                    raise
                 except Exception as e:
                     error = 'Reauthentication failed: {}'.format(e)
                     self.log.error(error)
@@ -346,14 +775,117 @@ class PGoApiRequest:
 
                 self._api_endpoint = parse_api_endpoint(new_api_endpoint)
                 api.set_api_endpoint(self._api_endpoint)
+                api.cache_api_endpoint()
 
                 execute = True  # reexecute the call
+            except (NianticOfflineException, UnexpectedResponseException) as e:
+                # a cached endpoint may be stale, start over at the default one.
+                # Timeouts and open circuits say nothing about the endpoint.
+                if not isinstance(e, (HashServerException, TimeoutException,
+                                      CircuitBreakerOpenException)):
+                    api.invalidate_api_endpoint(self._api_endpoint)
+                raise
+            except NianticThrottlingException:
+                if rate_limiter is not None:
+                    rate_limiter.throttled()
+                raise
+
+        if inventory_request is not None:
+            self._update_inventory_cache(request, response, inventory_cache,
+                                         inventory_request, use_dict)
 
         # cleanup after call execution
         self._req_method_list = []
+        self._raw_responses = set()
 
         return response
 
+    def _update_inventory_cache(self, request, response, inventory_cache,
+                                inventory_request, use_dict):
+        responses = response.get('responses', {}) if isinstance(
+            response, dict) else {}
+        inventory = responses.get('GET_INVENTORY')
+        if not isinstance(inventory, bytes):
+            return
+
+        # parse once and hand the message to both the cache and the caller,
+        # unless the caller asked for the raw response
+        entry_id = RequestType.Value('GET_INVENTORY')
+        if entry_id not in self._raw_responses:
+            inventory = request.parse_sub_response(entry_id, inventory, False)
+            if not isinstance(inventory, GetInventoryResponse):
+                # parse error, passed on to the caller as before
+                responses['GET_INVENTORY'] = inventory
+                return
+            responses['GET_INVENTORY'] = protobuf_to_dict(
+                inventory) if use_dict else inventory
+
+        try:
+            inventory_cache.update(
+                inventory, inventory_request.get('last_timestamp_ms', 0))
+        except Exception as e:
+            self.log.warning('Could not update the inventory cache: %s', e)
+
+    def _create_rpc(self, deadline):
+        api = self.__parent__
+        connect_timeout, read_timeout, _ = api.get_timeouts()
+
+        request_id = self._request_id
+        self._request_id = None
+        if request_id is None:
+            request_id = api.get_next_request_id()
+
+        request = RpcApi(self._auth_provider, self.device_info, self.state,
+                         request_id, api.get_start_time())
+        request._session = api._session
+        request.set_timeouts(connect_timeout, read_timeout, deadline)
+
+        hash_server_token = api.get_hash_server_token()
+        request.activate_hash_server(hash_server_token)
+        request.set_signature_encryptor(api.get_signature_encryptor())
+        return request
+
+    def prepare(self, timeout=None):
+        """
+        Builds, hashes and signs the request ahead of call(), e.g. while another
+        call of the same account is in flight. The request id is taken now, even
+        if preparing fails, so calls keep the order of their prepare(). call()
+        rebuilds the request if the session ticket changed meanwhile. Adding
+        another request method discards the prepared request but not its id.
+        """
+        api = self.__parent__
+        if self._prepared is None and self._request_id is None:
+            self._request_id = api.get_next_request_id()
+
+        if (self._position_lat is None) or (self._position_lng is None):
+            raise NoPlayerPositionSetException
+
+        if self._auth_provider is None or not self._auth_provider.is_login():
+            raise NotLoggedInException
+
+        connect_timeout, read_timeout, call_timeout = api.get_timeouts()
+        deadline = Deadline(timeout if timeout is not None else call_timeout)
+        request = self._prepared
+        if request is None:
+            request = self._prepared = self._create_rpc(deadline)
+        else:
+            request.set_timeouts(connect_timeout, read_timeout, deadline)
+
+        # if this fails call() builds the envelope of the prepared request
+        with span('pgoapi.prepare') as prepare_span:
+            if is_tracing_enabled():
+                prepare_span.set_attribute('request_types', [
+                    RequestType.Name(t) for t, _ in self._req_method_list
+                ])
+            request.prepare(self._req_method_list, self._req_platform_list,
+                            self.get_position())
+        return self
+
+    def _discard_prepared(self):
+        if self._prepared is not None:
+            self._request_id = self._prepared.request_id
+            self._prepared = None
+
     def list_curr_methods(self):
         for i in self._req_method_list:
             print("{} ({})".format(RequestType.Name(i), i))
@@ -378,7 +910,18 @@ class PGoApiRequest:
             elif not self._req_method_list:
                 self.log.info('Creating a new request...')
 
+            self._discard_prepared()
             name = func.upper()
+
+            # return the serialized sub response, e.g. for pgoapi.inventory
+            if kwargs.pop('_raw_response', False):
+                self._raw_responses.add(RequestType.Value(name))
+
+            # only ask for the changes since the cached inventory
+            inventory_cache = self.__parent__.get_inventory_cache()
+            if name == 'GET_INVENTORY' and inventory_cache is not None:
+                kwargs.setdefault('last_timestamp_ms',
+                                  inventory_cache.get_timestamp())
             if kwargs:
                 self._req_method_list.append((RequestType.Value(name), kwargs))
                 self.log.info("Adding '%s' to RPC request including arguments",
@@ -395,6 +938,7 @@ class PGoApiRequest:
             if '_call_direct' in kwargs:
                 del kwargs['_call_direct']
 
+            self._discard_prepared()
             name = func.upper()
             if kwargs:
                 self._req_platform_list.append(
@@ -0,0 +1,149 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from pgoapi.exceptions import DeadlineExceededException
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.last = time.time()
+
+    def refill(self, now, factor=1.0):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.last) * self.rate * factor)
+        self.last = now
+
+    def get_wait(self, factor=1.0, tokens=1):
+        """ Seconds until the bucket holds enough tokens, call refill first """
+        missing = tokens - self.tokens
+        if missing <= 0:
+            return 0
+        return missing / (self.rate * factor)
+
+
+class RateLimiter:
+    """
+    Client side rate limit of one account: a token bucket for all calls plus
+    optional buckets per request type (e.g. {'GET_MAP_OBJECTS': (0.2, 1)}
+    as (requests per second, burst)). A call waits until every bucket it
+    needs has a token.
+
+    Whenever the server throttles (status code 52) all rates are multiplied
+    by backoff, down to min_factor, and then recover linearly by recovery
+    per second back to the configured rates.
+    """
+
+    def __init__(self,
+                 rate=1.0,
+                 burst=None,
+                 request_rates=None,
+                 backoff=0.5,
+                 min_factor=0.05,
+                 recovery=0.01):
+        self.backoff = backoff
+        self.min_factor = min_factor
+        self.recovery = recovery
+
+        self._lock = threading.Lock()
+        self._factor = 1.0
+        self._last_update = time.time()
+        self._bucket = TokenBucket(rate, burst)
+        self._request_buckets = {}
+        for request_type, (request_rate, request_burst) in (
+                request_rates or {}).items():
+            self._request_buckets[request_type.upper()] = TokenBucket(
+                request_rate, request_burst)
+
+    def get_factor(self):
+        with self._lock:
+            self._update(time.time())
+            return self._factor
+
+    def _update(self, now):
+        self._factor = min(1.0, self._factor +
+                           (now - self._last_update) * self.recovery)
+        self._last_update = now
+
+    def _get_buckets(self, request_types):
+        buckets = [self._bucket]
+        for request_type in request_types:
+            bucket = self._request_buckets.get(request_type)
+            if bucket is not None and bucket not in buckets:
+                buckets.append(bucket)
+        return buckets
+
+    def try_acquire(self, request_types=()):
+        """ Takes the tokens and returns 0, or returns the seconds to wait """
+        buckets = self._get_buckets(request_types)
+        with self._lock:
+            now = time.time()
+            self._update(now)
+            for bucket in buckets:
+                bucket.refill(now, self._factor)
+
+            wait = max(bucket.get_wait(self._factor) for bucket in buckets)
+            if wait > 0:
+                return wait
+
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return 0
+
+    def acquire(self, request_types=(), deadline=None):
+        while True:
+            wait = self.try_acquire(request_types)
+            if wait <= 0:
+                return
+
+            if deadline is not None:
+                remaining = deadline.remaining()
+                if remaining is not None and remaining < wait:
+                    raise DeadlineExceededException(
+                        'Rate limit wait exceeds the call deadline.')
+
+            log.debug('Rate limited, waiting %.2fs', wait)
+            time.sleep(wait)
+
+    def throttled(self):
+        with self._lock:
+            self._update(time.time())
+            self._factor = max(self.min_factor, self._factor * self.backoff)
+            for bucket in self._get_buckets(self._request_buckets):
+                bucket.tokens = min(bucket.tokens, 0)
+            factor = self._factor
+
+        log.info('Server throttled, reducing request rate to %d%%.',
+                 factor * 100)
@@ -26,9 +26,12 @@ Author: tjado <https://github.com/tejado>
 from __future__ import absolute_import
 
 import os
+import time
+import base64
 import random
 import logging
 import requests
+import threading
 import subprocess
 import ctypes
 
@@ -36,11 +39,14 @@ from importlib import import_module
 
 from google.protobuf import message
 from protobuf_to_dict import protobuf_to_dict
-from pycrypt import pycrypt
 
-from pgoapi.exceptions import (AuthTokenExpiredException, BadRequestException, MalformedNianticResponseException, NianticIPBannedException, NianticOfflineException, NianticThrottlingException, NianticTimeoutException, NotLoggedInException, ServerApiEndpointRedirectException, UnexpectedResponseException)
-from pgoapi.utilities import to_camel_case, get_time, get_format_time_diff, weighted_choice
+from pgoapi.exceptions import (AuthTokenExpiredException, BadRequestException, DeadlineExceededException, MalformedNianticResponseException, NianticCircuitOpenException, NianticIPBannedException, NianticOfflineException, NianticThrottlingException, NianticTimeoutException, NotLoggedInException, ServerApiEndpointRedirectException, UnexpectedResponseException)
+from pgoapi.utilities import to_camel_case, get_time, get_request_timeout, send_request, weighted_choice
+from pgoapi import metrics
 from pgoapi.hash_server import HashServer
+from pgoapi.tracing import span
+from pgoapi.circuit_breaker import get_circuit_breaker
+from pgoapi.signature_encryptor import get_default_signature_encryptor
 
 from . import protos
 from pogoprotos.networking.envelopes.request_envelope_pb2 import RequestEnvelope
@@ -63,7 +69,9 @@ class RpcApi:
 
         # mystical unknown6 - resolved by PokemonGoDev
         self._hash_engine = None
+        self._signature_encryptor = get_default_signature_encryptor()
         self.request_proto = None
+        self._request_ticket = None
 
         # data fields for SignalAgglom
         self.token2 = random.randint(1, 59)
@@ -72,8 +80,25 @@ class RpcApi:
         self.state = state
         self.device_info = device_info
 
+        self.connect_timeout = 30
+        self.read_timeout = 30
+        self.deadline = None
+
+    def set_timeouts(self, connect_timeout, read_timeout, deadline=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        # a prepared request rebuilt by call() has to hash within its deadline
+        if isinstance(self._hash_engine, HashServer):
+            self._hash_engine.set_timeouts(connect_timeout, read_timeout,
+                                           deadline)
+
     def activate_hash_server(self, auth_token):
-        self._hash_engine = HashServer(auth_token)
+        self._hash_engine = HashServer(auth_token, self.connect_timeout,
+                                       self.read_timeout, self.deadline)
+
+    def set_signature_encryptor(self, encryptor):
+        self._signature_encryptor = encryptor or get_default_signature_encryptor()
 
     def decode_raw(self, raw):
         output = error = None
@@ -98,14 +123,49 @@ class RpcApi:
     def _make_rpc(self, endpoint, request_proto_plain):
         self.log.debug('Execution of RPC')
 
+        # before allow_request(), a granted half-open trial must report a result
+        timeout = get_request_timeout(self.connect_timeout, self.read_timeout,
+                                      self.deadline)
+        # a timeout shortened by the caller's deadline says nothing about the endpoint
+        full_timeout = timeout == (self.connect_timeout, self.read_timeout)
         request_proto_serialized = request_proto_plain.SerializeToString()
+
+        breaker = get_circuit_breaker('rpc:' + endpoint)
+        if not breaker.allow_request():
+            raise NianticCircuitOpenException(
+                'RPC endpoint unavailable, circuit breaker is open.',
+                breaker.retry_after())
+
+        metrics.BYTES_SENT.inc(len(request_proto_serialized))
         try:
-            http_response = self._session.post(
-                endpoint, data=request_proto_serialized, timeout=30)
+            http_response = send_request(
+                self._session, 'POST', endpoint, timeout, self.deadline,
+                data=request_proto_serialized)
+        except DeadlineExceededException:
+            breaker.record_ignored()
+            metrics.RPC_RESPONSES.labels('timeout', 'none').inc()
+            raise
         except requests.exceptions.Timeout:
+            if full_timeout:
+                breaker.record_failure()
+            else:
+                breaker.record_ignored()
+            metrics.RPC_RESPONSES.labels('timeout', 'none').inc()
             raise NianticTimeoutException('RPC request timed out.')
         except requests.exceptions.ConnectionError as e:
+            breaker.record_failure()
+            metrics.RPC_RESPONSES.labels('error', 'none').inc()
             raise NianticOfflineException(e)
+        except Exception:
+            breaker.record_failure()
+            metrics.RPC_RESPONSES.labels('error', 'none').inc()
+            raise
+        metrics.BYTES_RECEIVED.inc(len(http_response.content))
+
+        if http_response.status_code in (502, 503, 504):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
 
         return http_response
 
@@ -114,17 +174,53 @@ class RpcApi:
                 subrequests,
                 platforms,
                 player_position,
-                use_dict=True):
+                use_dict=True,
+                raw_responses=()):
 
         if not self._auth_provider or self._auth_provider.is_login() is False:
             raise NotLoggedInException()
 
-        self.request_proto = self.request_proto or self._build_main_request(
-            subrequests, platforms, player_position)
-        response = self._make_rpc(endpoint, self.request_proto)
+        # don't waste a hash on an endpoint which fails fast anyway
+        breaker = get_circuit_breaker('rpc:' + endpoint)
+        if not breaker.is_available():
+            raise NianticCircuitOpenException(
+                'RPC endpoint unavailable, circuit breaker is open.',
+                breaker.retry_after())
 
-        response_dict = self._parse_main_response(response, subrequests,
-                                                  use_dict)
+        if self.request_proto is not None and self._is_ticket_changed():
+            self.log.debug(
+                'Session Ticket changed since the request was prepared - rebuilding it')
+            self.request_proto = None
+
+        if self.request_proto is None:
+            start = time.time()
+            with span('build_envelope'):
+                self.request_proto = self._build_main_request(
+                    subrequests, platforms, player_position)
+            metrics.ENVELOPE_BUILD_SECONDS.observe(time.time() - start)
+
+        request_type = RequestType.Name(
+            subrequests[0][0]) if subrequests else 'NONE'
+        start = time.time()
+        with span('rpc', endpoint=endpoint) as rpc_span:
+            response = self._make_rpc(endpoint, self.request_proto)
+            rpc_span.set_attribute('http_status', response.status_code)
+            rpc_span.set_attribute('response_size', len(response.content))
+        metrics.RPC_SECONDS.labels(request_type).observe(time.time() - start)
+
+        start = time.time()
+        try:
+            with span('parse'):
+                response_dict = self._parse_main_response(
+                    response, subrequests, use_dict, raw_responses)
+        except ServerApiEndpointRedirectException:
+            metrics.RPC_RESPONSES.labels(response.status_code, 53).inc()
+            metrics.REDIRECTS.inc()
+            raise
+        except Exception:
+            metrics.RPC_RESPONSES.labels(response.status_code, 'none').inc()
+            raise
+        metrics.PARSE_SECONDS.observe(time.time() - start)
 
         # some response validations
         if isinstance(response_dict, dict):
@@ -142,14 +238,18 @@ class RpcApi:
                     self.check_authentication(ticket.expire_timestamp_ms,
                                               ticket.start, ticket.end)
 
+            metrics.RPC_RESPONSES.labels(response.status_code,
+                                         status_code).inc()
             if status_code == 102:
                 raise AuthTokenExpiredException
             elif status_code == 52:
+                metrics.THROTTLES.inc()
                 raise NianticThrottlingException(
                     "Request throttled by server... slow down man")
             elif status_code == 53:
                 api_url = response_dict.get('api_url')
                 if api_url:
+                    metrics.REDIRECTS.inc()
                     exception = ServerApiEndpointRedirectException()
                     exception.set_redirected_endpoint(api_url)
                     raise exception
@@ -158,23 +258,17 @@ class RpcApi:
 
         return response_dict
 
-    def check_authentication(self, expire_timestamp_ms, start, end):
-        if self._auth_provider.is_new_ticket(expire_timestamp_ms):
-
-            had_ticket = self._auth_provider.has_ticket()
-            self._auth_provider.set_ticket([expire_timestamp_ms, start, end])
+    def prepare(self, subrequests, platforms, player_position):
+        """ Builds, hashes and signs the request envelope ahead of request() """
+        self.request_proto = self._build_main_request(subrequests, platforms,
+                                                      player_position)
 
-            now_ms = get_time(ms=True)
-            h, m, s = get_format_time_diff(now_ms, expire_timestamp_ms, True)
+    def _is_ticket_changed(self):
+        ticket = self._auth_provider.get_serialized_ticket()
+        return (ticket[1] if ticket else None) != self._request_ticket
 
-            if had_ticket:
-                self.log.debug(
-                    'Replacing old Session Ticket with new one valid for %02d:%02d:%02d hours (%s < %s)',
-                    h, m, s, now_ms, expire_timestamp_ms)
-            else:
-                self.log.debug(
-                    'Received Session Ticket valid for %02d:%02d:%02d hours (%s < %s)',
-                    h, m, s, now_ms, expire_timestamp_ms)
+    def check_authentication(self, expire_timestamp_ms, start, end):
+        self._auth_provider.update_ticket([expire_timestamp_ms, start, end])
 
     def _build_main_request(self, subrequests, platforms,
                             player_position=None):
@@ -201,47 +295,62 @@ class RpcApi:
         request = self._build_sub_requests(request, subrequests)
         request = self._build_platform_requests(request, platforms)
 
-        ticket = self._auth_provider.get_ticket()
+        ticket = self._auth_provider.get_serialized_ticket()
         if ticket:
             self.log.debug(
                 'Found Session Ticket - using this instead of oauth token')
-            request.auth_ticket.expire_timestamp_ms, request.auth_ticket.start, request.auth_ticket.end = ticket
-            ticket_serialized = request.auth_ticket.SerializeToString()
+            ticket_proto, ticket_serialized = ticket
+            request.auth_ticket.CopyFrom(ticket_proto)
+            self._request_ticket = ticket_serialized
 
         else:
             self.log.debug(
                 'No Session Ticket found - using OAUTH Access Token')
+            self._request_ticket = None
             auth_provider = self._auth_provider
             request.auth_info.provider = auth_provider.get_name()
-            request.auth_info.token.contents = auth_provider.get_access_token()
+            request.auth_info.token.contents = auth_provider.get_access_token(
+                deadline=self.deadline)
             request.auth_info.token.unknown2 = self.token2
             # Sig uses this when no auth_ticket available.
             ticket_serialized = request.auth_info.SerializeToString()
 
+        # read back values from locals, protobuf attribute access is not free
+        latitude = request.latitude
+        longitude = request.longitude
+        accuracy = request.accuracy
+        session_hash = self.state.session_hash
+        timestamp = get_time(ms=True)
+        timestamp_since_start = timestamp - self.start_time
+        triangular = random.triangular
+
         sig = Signature()
 
-        sig.session_hash = self.state.session_hash
-        sig.timestamp = get_time(ms=True)
-        sig.timestamp_since_start = get_time(ms=True) - self.start_time
+        sig.session_hash = session_hash
+        sig.timestamp = timestamp
+        sig.timestamp_since_start = timestamp_since_start
 
-        self._hash_engine.hash(sig.timestamp, request.latitude,
-                               request.longitude, request.accuracy,
-                               ticket_serialized, sig.session_hash,
-                               request.requests)
+        with span('hash', requests=len(request.requests)):
+            self._hash_engine.hash(timestamp, latitude, longitude, accuracy,
+                                   ticket_serialized, session_hash,
+                                   request.requests)
         sig.location_hash1 = self._hash_engine.get_location_auth_hash()
         sig.location_hash2 = self._hash_engine.get_location_hash()
-        for req_hash in self._hash_engine.get_request_hashes():
-            sig.request_hash.append(ctypes.c_uint64(req_hash).value)
+        sig.request_hash.extend([
+            ctypes.c_uint64(req_hash).value
+            for req_hash in self._hash_engine.get_request_hashes()
+        ])
 
         loc = sig.location_fix.add()
         sen = sig.sensor_info.add()
 
-        sen.timestamp_snapshot = sig.timestamp_since_start - int(random.triangular(93, 4900, 3000))
-        loc.timestamp_snapshot = sig.timestamp_since_start - int(random.triangular(320, 3000, 1000))
+        sen.timestamp_snapshot = timestamp_since_start - int(triangular(93, 4900, 3000))
+        loc_timestamp_snapshot = timestamp_since_start - int(triangular(320, 3000, 1000))
+        loc.timestamp_snapshot = loc_timestamp_snapshot
 
         loc.provider = 'fused'
-        loc.latitude = request.latitude
-        loc.longitude = request.longitude
+        loc.latitude = latitude
+        loc.longitude = longitude
 
         loc.altitude = altitude or random.uniform(150, 250)
 
@@ -251,13 +360,13 @@ class RpcApi:
             loc.speed = -1
         else:
             loc.course = self.state.course
-            loc.speed = random.triangular(0.25, 9.7, 8.2)
+            loc.speed = triangular(0.25, 9.7, 8.2)
 
         loc.provider_status = 3
         loc.location_type = 1
-        if isinstance(request.accuracy, float):
+        if isinstance(accuracy, float):
             loc.horizontal_accuracy = weighted_choice([
-                (request.accuracy, 50),
+                (accuracy, 50),
                 (65, 40),
                 (200, 10)
             ])
@@ -272,8 +381,8 @@ class RpcApi:
                 (96, 1)
             ])
         else:
-            loc.horizontal_accuracy = request.accuracy
-            if request.accuracy >= 10:
+            loc.horizontal_accuracy = accuracy
+            if accuracy >= 10:
                 loc.vertical_accuracy = weighted_choice([
                     (6, 4),
                     (8, 34),
@@ -309,25 +418,25 @@ class RpcApi:
             sen.magnetic_field_y = self.state.magnetic_field_y
             sen.magnetic_field_z = self.state.magnetic_field_z
 
-        sen.linear_acceleration_x = random.triangular(-1.5, 2.5, 0)
-        sen.linear_acceleration_y = random.triangular(-1.2, 1.4, 0)
-        sen.linear_acceleration_z = random.triangular(-1.4, .9, 0)
-        sen.attitude_pitch = random.triangular(-1.56, 1.57, 0.475)
-        sen.attitude_yaw = random.triangular(-1.56, 3.14, .1)
-        sen.attitude_roll = random.triangular(-3.14, 3.14, 0)
-        sen.rotation_rate_x = random.triangular(-3.2, 3.52, 0)
-        sen.rotation_rate_y = random.triangular(-3.1, 4.88, 0)
-        sen.rotation_rate_z = random.triangular(-6, 3.7, 0)
-        sen.gravity_x = random.triangular(-1, 1, 0.01)
-        sen.gravity_y = random.triangular(-1, 1, -.4)
-        sen.gravity_z = random.triangular(-1, 1, -.4)
+        sen.linear_acceleration_x = triangular(-1.5, 2.5, 0)
+        sen.linear_acceleration_y = triangular(-1.2, 1.4, 0)
+        sen.linear_acceleration_z = triangular(-1.4, .9, 0)
+        sen.attitude_pitch = triangular(-1.56, 1.57, 0.475)
+        sen.attitude_yaw = triangular(-1.56, 3.14, .1)
+        sen.attitude_roll = triangular(-3.14, 3.14, 0)
+        sen.rotation_rate_x = triangular(-3.2, 3.52, 0)
+        sen.rotation_rate_y = triangular(-3.1, 4.88, 0)
+        sen.rotation_rate_z = triangular(-6, 3.7, 0)
+        sen.gravity_x = triangular(-1, 1, 0.01)
+        sen.gravity_y = triangular(-1, 1, -.4)
+        sen.gravity_z = triangular(-1, 1, -.4)
         sen.status = 3
 
         sig.unknown25 = 3081064678568720862
 
         if self.device_info:
-            for key in self.device_info:
-                setattr(sig.device_info, key, self.device_info[key])
+            sig.device_info.CopyFrom(
+                self.state.get_device_info_proto(self.device_info))
             if self.device_info['device_brand'] == 'Apple':
                 sig.activity_status.stationary = True
         else:
@@ -343,13 +452,14 @@ class RpcApi:
             plat8.request_message = plat_eight.SerializeToString()
 
         sig_request = SendEncryptedSignatureRequest()
-        sig_request.encrypted_signature = pycrypt(signature_proto,
-                                                  sig.timestamp_since_start)
+        with span('encrypt', signature_size=len(signature_proto)):
+            sig_request.encrypted_signature = self._signature_encryptor.encrypt(
+                signature_proto, timestamp_since_start)
         plat = request.platform_requests.add()
         plat.type = 6
         plat.request_message = sig_request.SerializeToString()
 
-        request.ms_since_last_locationfix = sig.timestamp_since_start - loc.timestamp_snapshot
+        request.ms_since_last_locationfix = timestamp_since_start - loc_timestamp_snapshot
 
         self.log.debug('Generated protobuf request: \n\r%s', request)
 
@@ -454,7 +564,11 @@ class RpcApi:
 
         return proto.SerializeToString()
 
-    def _parse_main_response(self, response_raw, subrequests, use_dict=True):
+    def _parse_main_response(self,
+                             response_raw,
+                             subrequests,
+                             use_dict=True,
+                             raw_responses=()):
         self.log.debug('Parsing main RPC response...')
 
         if response_raw.status_code == 400:
@@ -488,12 +602,14 @@ class RpcApi:
 
         self.log.debug('Protobuf structure of rpc response:\n\r%s',
                        response_proto)
-        try:
-            self.log.debug(
-                'Decode raw over protoc (protoc has to be in your PATH):\n\r%s',
-                self.decode_raw(response_raw.content).decode('utf-8'))
-        except Exception:
-            self.log.debug('Error during protoc parsing - ignored.')
+        # spawns protoc, so only when its output is going to be logged
+        if self.log.isEnabledFor(logging.DEBUG):
+            try:
+                self.log.debug(
+                    'Decode raw over protoc (protoc has to be in your PATH):\n\r%s',
+                    self.decode_raw(response_raw.content).decode('utf-8'))
+            except Exception:
+                self.log.debug('Error during protoc parsing - ignored.')
 
         if use_dict:
             response_proto_dict = protobuf_to_dict(response_proto)
@@ -507,7 +623,8 @@ class RpcApi:
                 'Could not convert protobuf to dict.')
 
         response_proto_dict = self._parse_sub_responses(
-            response_proto, subrequests, response_proto_dict, use_dict)
+            response_proto, subrequests, response_proto_dict, use_dict,
+            raw_responses)
 
         # It can't be done before.
         if not use_dict:
@@ -519,7 +636,8 @@ class RpcApi:
                              response_proto,
                              subrequests_list,
                              response_proto_dict,
-                             use_dict=True):
+                             use_dict=True,
+                             raw_responses=()):
         self.log.debug('Parsing sub RPC responses...')
         response_proto_dict['responses'] = {}
 
@@ -532,40 +650,51 @@ class RpcApi:
         for subresponse in response_proto.returns:
             entry_id, _ = subrequests_list[i]
             entry_name = RequestType.Name(entry_id)
-            proto_name = entry_name.lower() + '_response'
-            proto_classname = 'pogoprotos.networking.responses.' + proto_name + '_pb2.' + proto_name
 
-            self.log.debug("Parsing class: %s", proto_classname)
+            if entry_id in raw_responses:
+                subresponse_return = subresponse
+            else:
+                subresponse_return = self.parse_sub_response(
+                    entry_id, subresponse, use_dict)
+
+            response_proto_dict['responses'][entry_name] = subresponse_return
+            i += 1
+
+        return response_proto_dict
+
+    def parse_sub_response(self, entry_id, subresponse, use_dict=True):
+        entry_name = RequestType.Name(entry_id)
+        proto_name = entry_name.lower() + '_response'
+        proto_classname = 'pogoprotos.networking.responses.' + proto_name + '_pb2.' + proto_name
+
+        self.log.debug("Parsing class: %s", proto_classname)
 
-            subresponse_return = None
+        subresponse_return = None
+        try:
+            subresponse_extension = self.get_class(proto_classname)()
+        except Exception:
+            subresponse_extension = None
+            error = 'Protobuf definition for {} not found'.format(
+                proto_classname)
+            subresponse_return = error
+            self.log.warning(error)
+
+        if subresponse_extension:
             try:
-                subresponse_extension = self.get_class(proto_classname)()
+                subresponse_extension.ParseFromString(subresponse)
+                if use_dict:
+
+                    subresponse_return = protobuf_to_dict(
+                        subresponse_extension)
+                else:
+                    subresponse_return = subresponse_extension
             except Exception:
-                subresponse_extension = None
-                error = 'Protobuf definition for {} not found'.format(
+                error = "Protobuf definition for {} seems not to match".format(
                     proto_classname)
                 subresponse_return = error
                 self.log.warning(error)
 
-            if subresponse_extension:
-                try:
-                    subresponse_extension.ParseFromString(subresponse)
-                    if use_dict:
-
-                        subresponse_return = protobuf_to_dict(
-                            subresponse_extension)
-                    else:
-                        subresponse_return = subresponse_extension
-                except Exception:
-                    error = "Protobuf definition for {} seems not to match".format(
-                        proto_classname)
-                    subresponse_return = error
-                    self.log.warning(error)
-
-            response_proto_dict['responses'][entry_name] = subresponse_return
-            i += 1
-
-        return response_proto_dict
+        return subresponse_return
 
 
 # Original by Noctem.
@@ -579,6 +708,35 @@ class RpcState:
         self.mag_z_min = random.uniform(-70, 40)
         self.mag_z_max = self.mag_y_min + 15
         self._course = random.uniform(0, 359.99)
+        self._course_lock = threading.Lock()
+        self._device_info = None
+        self._device_info_proto = None
+
+    def get_state(self):
+        return {
+            'session_hash': base64.b64encode(self.session_hash).decode('ascii'),
+            'magnetic_field': [
+                self.mag_x_min, self.mag_x_max, self.mag_y_min,
+                self.mag_y_max, self.mag_z_min, self.mag_z_max
+            ],
+            'course': self._course
+        }
+
+    def set_state(self, state):
+        self.session_hash = base64.b64decode(state['session_hash'])
+        (self.mag_x_min, self.mag_x_max, self.mag_y_min, self.mag_y_max,
+         self.mag_z_min, self.mag_z_max) = state['magnetic_field']
+        self._course = state['course']
+
+    def get_device_info_proto(self, device_info):
+        """ DeviceInfo sub-message, built once and copied into every Signature """
+        if self._device_info != device_info:
+            proto = Signature.DeviceInfo()
+            for key in device_info:
+                setattr(proto, key, device_info[key])
+            self._device_info_proto = proto
+            self._device_info = dict(device_info)
+        return self._device_info_proto
 
     @property
     def magnetic_field_x(self):
@@ -594,5 +752,6 @@ class RpcState:
 
     @property
     def course(self):
-        self._course = random.triangular(0, 359.99, self._course)
-        return self._course
+        with self._course_lock:
+            self._course = random.triangular(0, 359.99, self._course)
+            return self._course
@@ -0,0 +1,136 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+from six.moves.urllib.parse import quote
+
+from pgoapi.utilities import replace_file
+
+log = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """ Persists PGoApi.get_session() snapshots by key (usually the username) """
+
+    def load(self, key):
+        raise NotImplementedError()
+
+    def save(self, key, session):
+        raise NotImplementedError()
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+
+class FileSessionStore(SessionStore):
+    """ One JSON file per session inside a directory """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, quote(key, safe='') + '.json')
+
+    def load(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+
+        try:
+            with open(path) as data:
+                return json.load(data)
+        except (IOError, OSError, ValueError) as e:
+            log.warning('Could not load session %s: %s', key, e)
+            return None
+
+    def save(self, key, session):
+        path = self._path(key)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as data:
+                json.dump(session, data)
+            replace_file(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        path = self._path(key)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+class SqliteSessionStore(SessionStore):
+    """ All sessions in one SQLite database, safe to share between threads """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._db.execute('CREATE TABLE IF NOT EXISTS sessions '
+                             '(key TEXT PRIMARY KEY, data TEXT, updated INTEGER)')
+            self._db.commit()
+
+    def load(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT data FROM sessions WHERE key = ?',
+                                   (key, )).fetchone()
+        if row is None:
+            return None
+
+        try:
+            return json.loads(row[0])
+        except ValueError as e:
+            log.warning('Could not load session %s: %s', key, e)
+            return None
+
+    def save(self, key, session):
+        data = json.dumps(session)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO sessions (key, data, updated) VALUES (?, ?, ?)',
+                (key, data, int(time.time())))
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute('DELETE FROM sessions WHERE key = ?', (key, ))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,325 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+from __future__ import absolute_import
+
+import struct
+import logging
+import threading
+import multiprocessing
+
+from six.moves import queue
+
+from pgoapi.pgoapi import PGoApi
+from pgoapi.account_pool import AccountPool
+from pgoapi.bulk_login import bulk_ptc_login
+from pgoapi.utilities import f2i, get_cell_ids
+
+log = logging.getLogger(__name__)
+
+# encounter_id, spawn point cell id, pokemon_id, latitude, longitude, disappear time (ms)
+WILD_POKEMON_RECORD = struct.Struct('<QQHddq')
+
+
+def scan_wild_pokemon(api, lat, lng):
+    """
+    Default scan function: one GET_MAP_OBJECTS call, parsed in proto mode and
+    reduced to WILD_POKEMON_RECORD tuples. Custom scan functions must be
+    defined at module level so they can be sent to the worker processes.
+    """
+    api.set_position(lat, lng, 0)
+    cell_ids = get_cell_ids(lat, lng)
+    request = api.create_request()
+    request.get_map_objects(
+        latitude=f2i(lat),
+        longitude=f2i(lng),
+        since_timestamp_ms=[0] * len(cell_ids),
+        cell_id=cell_ids)
+    response = request.call(use_dict=False)
+
+    map_objects = response['responses'].get('GET_MAP_OBJECTS')
+    if map_objects is None or isinstance(map_objects, str):
+        return []
+
+    records = []
+    for cell in map_objects.map_cells:
+        for pokemon in cell.wild_pokemons:
+            try:
+                spawn_point = int(pokemon.spawn_point_id, 16)
+            except ValueError:
+                spawn_point = 0
+            if 0 < pokemon.time_till_hidden_ms <= 3600000:
+                disappear_ms = cell.current_timestamp_ms + pokemon.time_till_hidden_ms
+            else:
+                disappear_ms = 0
+            records.append(
+                (pokemon.encounter_id, spawn_point,
+                 pokemon.pokemon_data.pokemon_id, pokemon.latitude,
+                 pokemon.longitude, disappear_ms))
+    return records
+
+
+def _create_api(account, hash_key, auth_provider=None):
+    api = PGoApi(device_info=account.get('device_info'))
+    api.set_position(*account.get('position', (0.0, 0.0, 0.0)))
+    if auth_provider is not None:
+        api.set_auth_provider(auth_provider)
+    else:
+        api.set_authentication(
+            provider=account.get('provider', 'ptc'),
+            username=account['username'],
+            password=account['password'],
+            proxy_config=account.get('proxy'))
+    api.activate_hash_server(hash_key)
+    return api
+
+
+def _login(shard, accounts, options):
+    """ Yields (username, PGoApi) of the accounts which could log in """
+    # PTC accounts log in concurrently, Google ones one after the other
+    ptc_accounts = dict((account['username'], account) for account in accounts
+                        if account.get('provider', 'ptc') == 'ptc')
+    logins = bulk_ptc_login(
+        [(username, account['password'], account.get('proxy'))
+         for username, account in ptc_accounts.items()],
+        workers=options['login_workers'])
+    for result in logins:
+        if not result.is_success():
+            log.warning('Shard %s: login of %s failed: %s', shard,
+                        result.username, result.error)
+            continue
+        yield result.username, _create_api(ptc_accounts[result.username],
+                                           options['hash_key'],
+                                           result.auth_provider)
+
+    for account in accounts:
+        if account.get('provider', 'ptc') == 'ptc':
+            continue
+        try:
+            yield account['username'], _create_api(account,
+                                                   options['hash_key'])
+        except Exception as e:
+            log.warning('Shard %s: login of %s failed: %s', shard,
+                        account['username'], e)
+
+
+def _run_shard(shard, accounts, points, options, results):
+    """ Always reports 'done', the parent waits for it """
+    scanned = [0]
+    try:
+        _scan_shard(shard, accounts, points, options, results, scanned)
+    except Exception as e:
+        log.exception('Shard %s failed.', shard)
+        results.put(('error', shard, 'Shard failed: {}'.format(e)))
+    finally:
+        results.put(('done', shard, scanned[0]))
+
+
+def _scan_shard(shard, accounts, points, options, results, scanned):
+    pool = AccountPool(
+        min_interval=options['min_interval'],
+        relogin=lambda api: api.get_auth_provider().get_access_token(
+            force_refresh=True))
+
+    for username, api in _login(shard, accounts, options):
+        pool.add(api, username)
+
+    if not pool.get_accounts():
+        results.put(('error', shard, 'No account could log in.'))
+        return
+
+    pending = queue.Queue()
+    for point in points:
+        pending.put(point)
+
+    record = struct.Struct(options['record_format'])
+    scan = options['scan']
+    batch_size = options['batch_size']
+    lock = threading.Lock()
+
+    def scan_worker():
+        batch = []
+        while True:
+            try:
+                lat, lng = pending.get_nowait()
+            except queue.Empty:
+                break
+
+            try:
+                records = pool.run(lambda api: scan(api, lat, lng))
+            except Exception as e:
+                results.put(('error', shard, 'Scan of {},{} failed: {}'.format(
+                    lat, lng, e)))
+                continue
+
+            batch.extend(records)
+            if len(batch) >= batch_size:
+                results.put(('records', shard,
+                             b''.join(record.pack(*r) for r in batch)))
+                batch = []
+
+            with lock:
+                scanned[0] += 1
+
+        if batch:
+            results.put(('records', shard,
+                         b''.join(record.pack(*r) for r in batch)))
+
+    def run_worker():
+        try:
+            scan_worker()
+        except Exception as e:
+            results.put(('error', shard, 'Scan thread failed: {}'.format(e)))
+
+    threads = [
+        threading.Thread(target=run_worker)
+        for i in range(min(options['threads'], len(points)))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _split(items, parts):
+    size, rest = divmod(len(items), parts)
+    chunks = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < rest else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+class ShardedScanner:
+    """
+    Spreads accounts and scan points over a pool of processes to get around
+    the GIL. Every process logs in its share of the accounts (PTC ones
+    concurrently on login_workers threads), scans its
+    contiguous share of the points on a thread pool via an AccountPool and
+    sends the results back packed as fixed size binary records through a
+    multiprocessing queue to the aggregating parent process. Shard processes
+    which die without finishing are reported in errors, checked every
+    poll_interval seconds.
+
+    accounts are dicts with username, password and optionally provider,
+    proxy, position and device_info. points are (lat, lng) tuples.
+    """
+
+    def __init__(self,
+                 accounts,
+                 points,
+                 hash_key,
+                 processes=None,
+                 threads=4,
+                 min_interval=10,
+                 scan=scan_wild_pokemon,
+                 record_format=WILD_POKEMON_RECORD.format,
+                 batch_size=256,
+                 poll_interval=5,
+                 login_workers=20):
+        self.accounts = list(accounts)
+        self.points = list(points)
+        self.processes = min(processes or multiprocessing.cpu_count(),
+                             len(self.accounts)) or 1
+        self.record = struct.Struct(record_format)
+        self.poll_interval = poll_interval
+        self.options = {
+            'hash_key': hash_key,
+            'threads': threads,
+            'min_interval': min_interval,
+            'scan': scan,
+            'record_format': record_format,
+            'batch_size': batch_size,
+            'login_workers': login_workers
+        }
+        self.errors = []
+        self.scanned = 0
+
+    def run(self):
+        """ Generator of the unpacked records of all shards, as they arrive """
+        results = multiprocessing.Queue()
+        account_shards = [
+            self.accounts[i::self.processes] for i in range(self.processes)
+        ]
+        point_shards = _split(self.points, self.processes)
+
+        workers = []
+        for shard in range(self.processes):
+            worker = multiprocessing.Process(
+                target=_run_shard,
+                args=(shard, account_shards[shard], point_shards[shard],
+                      self.options, results),
+                name='ShardedScanner-{}'.format(shard))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        running = dict(enumerate(workers))
+        exited = set()
+        try:
+            while running:
+                try:
+                    kind, shard, payload = results.get(
+                        timeout=self.poll_interval)
+                except queue.Empty:
+                    self._check_workers(running, exited)
+                    continue
+
+                if kind == 'records':
+                    for record in self._unpack(payload):
+                        yield record
+                elif kind == 'error':
+                    log.warning('Shard %s: %s', shard, payload)
+                    self.errors.append((shard, payload))
+                elif kind == 'done':
+                    self.scanned += payload
+                    running.pop(shard, None)
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+    def _check_workers(self, running, exited):
+        for shard, worker in list(running.items()):
+            if worker.is_alive():
+                continue
+            # its last messages may still be in the pipe, give it one more poll
+            if shard not in exited:
+                exited.add(shard)
+                continue
+
+            error = 'Shard process died with exit code {}.'.format(
+                worker.exitcode)
+            log.warning('Shard %s: %s', shard, error)
+            self.errors.append((shard, error))
+            del running[shard]
+
+    def _unpack(self, payload):
+        size = self.record.size
+        for offset in range(0, len(payload), size):
+            yield self.record.unpack_from(payload, offset)
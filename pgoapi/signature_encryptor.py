@@ -0,0 +1,117 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import logging
+import multiprocessing
+
+from multiprocessing.pool import ThreadPool
+
+from pycrypt import pycrypt
+
+log = logging.getLogger(__name__)
+
+
+def _encrypt(item):
+    signature, timestamp_since_start = item
+    return pycrypt(signature, timestamp_since_start)
+
+
+class SignatureEncryptor:
+    """
+    Encrypts serialized Signature messages with pycrypt. The base class runs
+    on the calling thread, see PoolSignatureEncryptor to move the work off it.
+    """
+
+    def encrypt(self, signature, timestamp_since_start):
+        return pycrypt(signature, timestamp_since_start)
+
+    def encrypt_async(self, signature, timestamp_since_start, callback=None):
+        """ Returns an object with get(), like multiprocessing's AsyncResult """
+        result = _Result(self.encrypt(signature, timestamp_since_start))
+        if callback is not None:
+            callback(result.get())
+        return result
+
+    def close(self):
+        pass
+
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, timeout=None):
+        return self.value
+
+    def ready(self):
+        return True
+
+
+class PoolSignatureEncryptor(SignatureEncryptor):
+    """
+    Runs pycrypt in a pool of worker threads, or worker processes with
+    processes=True. Threads only run in parallel if the pycrypt build
+    releases the GIL, processes always do at the cost of pickling every
+    signature to the worker and back.
+
+    Every envelope is encrypted on its own with a single encrypt() call,
+    which blocks the calling thread until its signature is done: encryption
+    is the last step before the envelope is sent, there is nothing to
+    overlap it with. The pool only pays off when many threads call at once,
+    e.g. accounts of an AccountPool or PGoApi.pipeline() preparing the next
+    request. A single sequential caller only gets the overhead. Call close()
+    when done with the pool.
+    """
+
+    def __init__(self, workers=None, processes=False):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.processes = processes
+        if processes:
+            self._pool = multiprocessing.Pool(self.workers)
+        else:
+            self._pool = ThreadPool(self.workers)
+
+    def encrypt(self, signature, timestamp_since_start):
+        return self._pool.apply_async(
+            _encrypt, ((signature, timestamp_since_start), )).get()
+
+    def encrypt_async(self, signature, timestamp_since_start, callback=None):
+        return self._pool.apply_async(
+            _encrypt, ((signature, timestamp_since_start), ),
+            callback=callback)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+_default_encryptor = SignatureEncryptor()
+
+
+def get_default_signature_encryptor():
+    return _default_encryptor
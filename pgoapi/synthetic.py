@@ -0,0 +1,267 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import random
+
+from s2sphere import CellId, LatLng
+
+from . import protos
+from pogoprotos.networking.envelopes.response_envelope_pb2 import ResponseEnvelope
+from pogoprotos.networking.responses.get_inventory_response_pb2 import GetInventoryResponse
+from pogoprotos.networking.responses.get_map_objects_response_pb2 import GetMapObjectsResponse
+
+# pokemon ids of generation 1 to 3
+MAX_POKEMON_ID = 386
+# item ids of balls, potions, revives and berries
+ITEM_IDS = (1, 2, 3, 101, 102, 103, 104, 201, 202, 701, 703, 705)
+MOVE_IDS = tuple(range(13, 138))
+
+TIMESTAMP_MS = 1500000000000
+
+
+class PayloadGenerator:
+    """
+    Builds synthetic but realistic responses for benchmarks, mock servers
+    and load tests. All values come from a random.Random seeded with seed,
+    so the same calls produce the same messages.
+
+    gen = PayloadGenerator(seed=1)
+    response = gen.get_map_objects_response(cells=50, wild_pokemon=3)
+    """
+
+    def __init__(self,
+                 seed=0,
+                 latitude=40.7589,
+                 longitude=-73.9851,
+                 timestamp_ms=TIMESTAMP_MS):
+        self.random = random.Random(seed)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timestamp_ms = timestamp_ms
+        self._next_id = 1
+
+    def get_id(self):
+        value = self._next_id
+        self._next_id += 1
+        return value
+
+    def get_cell_ids(self, cells):
+        """ cells consecutive level 15 cell ids starting at the position """
+        cell_id = CellId.from_lat_lng(
+            LatLng.from_degrees(self.latitude, self.longitude)).parent(15)
+        cell_ids = []
+        for i in range(cells):
+            cell_ids.append(cell_id.id())
+            cell_id = cell_id.next()
+        return cell_ids
+
+    def _get_position(self, center):
+        return (center.lat().degrees + self.random.uniform(-0.001, 0.001),
+                center.lng().degrees + self.random.uniform(-0.001, 0.001))
+
+    def _fill_pokemon_data(self, pokemon, pokemon_id=None):
+        rand = self.random
+        pokemon.pokemon_id = pokemon_id or rand.randint(1, MAX_POKEMON_ID)
+        pokemon.cp = rand.randint(10, 3500)
+        pokemon.stamina_max = rand.randint(10, 300)
+        pokemon.stamina = pokemon.stamina_max
+        pokemon.move_1 = rand.choice(MOVE_IDS)
+        pokemon.move_2 = rand.choice(MOVE_IDS)
+        pokemon.height_m = rand.uniform(0.2, 3.0)
+        pokemon.weight_kg = rand.uniform(0.5, 300.0)
+        pokemon.individual_attack = rand.randint(0, 15)
+        pokemon.individual_defense = rand.randint(0, 15)
+        pokemon.individual_stamina = rand.randint(0, 15)
+        pokemon.cp_multiplier = rand.uniform(0.094, 0.7903)
+        pokemon.pokemon_display.gender = rand.randint(1, 2)
+
+    def add_map_cell(self,
+                     response,
+                     cell_id,
+                     forts=2,
+                     spawn_points=4,
+                     wild_pokemon=2,
+                     catchable_pokemon=None,
+                     nearby_pokemon=2):
+        rand = self.random
+        center = CellId(cell_id).to_lat_lng()
+        cell = response.map_cells.add()
+        cell.s2_cell_id = cell_id
+        cell.current_timestamp_ms = self.timestamp_ms
+
+        fort_ids = []
+        for i in range(forts):
+            fort = cell.forts.add()
+            fort.id = '{:032x}.16'.format(rand.getrandbits(128))
+            fort.last_modified_timestamp_ms = self.timestamp_ms - rand.randint(
+                0, 86400000)
+            fort.latitude, fort.longitude = self._get_position(center)
+            fort.enabled = True
+            if rand.random() < 0.2:
+                fort.owned_by_team = rand.randint(1, 3)
+                fort.guard_pokemon_id = rand.randint(1, MAX_POKEMON_ID)
+                fort.guard_pokemon_cp = rand.randint(10, 3500)
+                fort.gym_points = rand.randint(0, 50000)
+            else:
+                fort.type = 1
+            fort_ids.append(fort.id)
+
+        spawn_point_ids = []
+        for i in range(spawn_points):
+            spawn_point = cell.spawn_points.add()
+            spawn_point.latitude, spawn_point.longitude = self._get_position(
+                center)
+            spawn_point_ids.append('{:x}'.format(
+                CellId.from_lat_lng(
+                    LatLng.from_degrees(spawn_point.latitude,
+                                        spawn_point.longitude)).parent(20)
+                .id() >> 24))
+
+        for i in range(wild_pokemon):
+            pokemon = cell.wild_pokemons.add()
+            pokemon.encounter_id = self.get_id()
+            pokemon.last_modified_timestamp_ms = self.timestamp_ms
+            pokemon.latitude, pokemon.longitude = self._get_position(center)
+            if spawn_point_ids:
+                pokemon.spawn_point_id = rand.choice(spawn_point_ids)
+            pokemon.time_till_hidden_ms = rand.randint(60000, 1800000)
+            self._fill_pokemon_data(pokemon.pokemon_data)
+
+            if catchable_pokemon is None:
+                catchable = cell.catchable_pokemons.add()
+                catchable.encounter_id = pokemon.encounter_id
+                catchable.spawn_point_id = pokemon.spawn_point_id
+                catchable.pokemon_id = pokemon.pokemon_data.pokemon_id
+                catchable.expiration_timestamp_ms = (
+                    self.timestamp_ms + pokemon.time_till_hidden_ms)
+                catchable.latitude = pokemon.latitude
+                catchable.longitude = pokemon.longitude
+
+        for i in range(catchable_pokemon or 0):
+            catchable = cell.catchable_pokemons.add()
+            catchable.encounter_id = self.get_id()
+            catchable.pokemon_id = rand.randint(1, MAX_POKEMON_ID)
+            catchable.expiration_timestamp_ms = self.timestamp_ms + rand.randint(
+                60000, 1800000)
+            catchable.latitude, catchable.longitude = self._get_position(
+                center)
+
+        for i in range(nearby_pokemon):
+            nearby = cell.nearby_pokemons.add()
+            nearby.pokemon_id = rand.randint(1, MAX_POKEMON_ID)
+            nearby.encounter_id = self.get_id()
+            nearby.distance_in_meters = rand.uniform(0, 200)
+            if fort_ids and rand.random() < 0.5:
+                nearby.fort_id = rand.choice(fort_ids)
+
+        return cell
+
+    def get_map_objects_response(self,
+                                 cells=20,
+                                 forts=2,
+                                 spawn_points=4,
+                                 wild_pokemon=2,
+                                 catchable_pokemon=None,
+                                 nearby_pokemon=2):
+        """
+        Response with cells map cells around the position. The other
+        arguments are the number of objects per cell, catchable pokemon
+        default to one per wild pokemon like the server sends them.
+        """
+        response = GetMapObjectsResponse()
+        response.status = 1
+        response.time_of_day = 1
+        for cell_id in self.get_cell_ids(cells):
+            self.add_map_cell(response, cell_id, forts, spawn_points,
+                              wild_pokemon, catchable_pokemon, nearby_pokemon)
+        return response
+
+    def get_inventory_response(self,
+                               pokemon=250,
+                               eggs=9,
+                               items=len(ITEM_IDS),
+                               candies=100,
+                               player_stats=True):
+        rand = self.random
+        response = GetInventoryResponse()
+        response.success = True
+        delta = response.inventory_delta
+        delta.new_timestamp_ms = self.timestamp_ms
+
+        def add_item():
+            item = delta.inventory_items.add()
+            item.modified_timestamp_ms = self.timestamp_ms - rand.randint(
+                0, 86400000)
+            return item.inventory_item_data
+
+        if player_stats:
+            stats = add_item().player_stats
+            stats.level = rand.randint(1, 40)
+            stats.experience = rand.randint(0, 20000000)
+            stats.km_walked = rand.uniform(0, 5000)
+
+        for i in range(pokemon):
+            data = add_item().pokemon_data
+            data.id = self.get_id()
+            self._fill_pokemon_data(data)
+            data.creation_time_ms = self.timestamp_ms - rand.randint(
+                0, 31536000000)
+            data.captured_cell_id = rand.getrandbits(63)
+
+        for i in range(eggs):
+            data = add_item().pokemon_data
+            data.id = self.get_id()
+            data.is_egg = True
+            data.egg_km_walked_target = rand.choice((2.0, 5.0, 10.0))
+            data.creation_time_ms = self.timestamp_ms - rand.randint(
+                0, 31536000000)
+
+        for i in range(items):
+            data = add_item().item
+            data.item_id = ITEM_IDS[i % len(ITEM_IDS)]
+            data.count = rand.randint(1, 200)
+
+        for family_id in rand.sample(range(1, MAX_POKEMON_ID + 1),
+                                     min(candies, MAX_POKEMON_ID)):
+            data = add_item().candy
+            data.family_id = family_id
+            data.candy = rand.randint(0, 1000)
+
+        return response
+
+    def get_response_envelope(self, responses, request_id=None):
+        """
+        Serialized ResponseEnvelope returning responses, a list of messages
+        in the order of the subrequests
+        """
+        envelope = ResponseEnvelope()
+        envelope.status_code = 1
+        envelope.request_id = request_id or self.get_id()
+        envelope.returns.extend(
+            response.SerializeToString() for response in responses)
+        return envelope.SerializeToString()
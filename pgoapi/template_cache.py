@@ -0,0 +1,244 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import os
+import logging
+import threading
+
+from google.protobuf.message import DecodeError
+
+from pgoapi.utilities import replace_file
+
+from . import protos
+from pogoprotos.enums.pokemon_type_pb2 import PokemonType
+from pogoprotos.networking.responses.download_item_templates_response_pb2 import DownloadItemTemplatesResponse
+from pogoprotos.networking.responses.download_settings_response_pb2 import DownloadSettingsResponse
+
+log = logging.getLogger(__name__)
+
+TEMPLATES_FILE = 'item_templates.bin'
+SETTINGS_FILE = 'settings.bin'
+
+
+class ItemTemplates:
+    """
+    Indexed view of the item templates (the game master): pokemon and move
+    settings by id, templates by template id and the type effectiveness
+    matrix, type_effectiveness[attack_type][defender_type].
+    """
+
+    def __init__(self, response):
+        self.timestamp_ms = response.timestamp_ms
+        self.templates = {}
+        self.pokemon_settings = {}
+        self.move_settings = {}
+        self.player_level = None
+
+        type_count = max(PokemonType.values()) + 1
+        self.type_effectiveness = [[1.0] * type_count
+                                   for i in range(type_count)]
+
+        for template in response.item_templates:
+            self.templates[template.template_id] = template
+            if template.HasField('pokemon_settings'):
+                settings = template.pokemon_settings
+                # the first template of a pokemon is the base form
+                self.pokemon_settings.setdefault(settings.pokemon_id, settings)
+            elif template.HasField('move_settings'):
+                settings = template.move_settings
+                self.move_settings[settings.movement_id] = settings
+            elif template.HasField('type_effective'):
+                settings = template.type_effective
+                row = self.type_effectiveness[settings.attack_type]
+                # the scalars start with POKEMON_TYPE_NORMAL
+                for defender_type, scalar in enumerate(
+                        settings.attack_scalar, 1):
+                    if defender_type < type_count:
+                        row[defender_type] = scalar
+            elif template.HasField('player_level'):
+                self.player_level = template.player_level
+
+    def __len__(self):
+        return len(self.templates)
+
+    def get_pokemon_settings(self, pokemon_id):
+        return self.pokemon_settings.get(pokemon_id)
+
+    def get_move_settings(self, movement_id):
+        return self.move_settings.get(movement_id)
+
+    def get_type_effectiveness(self, attack_type, defender_type,
+                               defender_type_2=0):
+        scalar = self.type_effectiveness[attack_type][defender_type]
+        if defender_type_2:
+            scalar *= self.type_effectiveness[attack_type][defender_type_2]
+        return scalar
+
+
+class TemplateCache:
+    """
+    Versioned cache of the item templates and the global settings.
+
+    Templates are stored with the item_templates_timestamp_ms of
+    DOWNLOAD_REMOTE_CONFIG_VERSION they were fetched for, the settings with
+    the hash of DOWNLOAD_SETTINGS. With a path (a directory) both are
+    persisted and shared by every account and process of the host, which
+    picks up newer files written by the others.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+
+        self._lock = threading.Lock()
+        # held while the templates are downloaded, see get_refresh_lock
+        self._refresh_lock = threading.RLock()
+        self._templates = None
+        self._settings = None
+        self._mtimes = {}
+
+        if path and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def get_templates_timestamp(self):
+        templates = self.get_templates()
+        return templates.timestamp_ms if templates else 0
+
+    def is_templates_current(self, timestamp_ms):
+        """ True if the cached templates are at least as new as timestamp_ms """
+        current = self.get_templates_timestamp()
+        return current > 0 and current >= timestamp_ms
+
+    def get_refresh_lock(self):
+        """
+        Lock of the template download. Accounts logging in at the same time
+        take it and check is_templates_current again, so only the first one
+        downloads the templates.
+        """
+        return self._refresh_lock
+
+    def get_templates(self):
+        """ ItemTemplates view, None if nothing is cached yet """
+        with self._lock:
+            response = self._load(TEMPLATES_FILE, DownloadItemTemplatesResponse)
+            if response is not None:
+                self._templates = ItemTemplates(response)
+            return self._templates
+
+    def set_templates(self, item_templates, timestamp_ms):
+        """ Stores the ItemTemplate messages of all pages, fetched for timestamp_ms """
+        response = DownloadItemTemplatesResponse()
+        response.result = DownloadItemTemplatesResponse.SUCCESS
+        response.timestamp_ms = timestamp_ms
+        response.item_templates.extend(item_templates)
+
+        with self._lock:
+            self._templates = ItemTemplates(response)
+            self._save(TEMPLATES_FILE, response)
+
+        log.info('Cached %s item templates of %s', len(response.item_templates),
+                 timestamp_ms)
+
+    def get_settings_hash(self):
+        settings = self.get_settings_response()
+        return settings.hash if settings else None
+
+    def get_settings(self):
+        """ GlobalSettings message, None if nothing is cached yet """
+        settings = self.get_settings_response()
+        return settings.settings if settings else None
+
+    def get_settings_response(self):
+        with self._lock:
+            response = self._load(SETTINGS_FILE, DownloadSettingsResponse)
+            if response is not None:
+                self._settings = response
+            return self._settings
+
+    def update_settings(self, response):
+        """ Stores a DOWNLOAD_SETTINGS response if it carries new settings """
+        if response.error or not response.hash or not response.HasField(
+                'settings'):
+            return False
+
+        with self._lock:
+            if self._settings is not None and self._settings.hash == response.hash:
+                return False
+            self._settings = response
+            self._save(SETTINGS_FILE, response)
+
+        log.info('Cached settings %s', response.hash)
+        return True
+
+    def _load(self, filename, message_class):
+        """ Message from the file if it changed since the last load, else None """
+        if not self.path:
+            return None
+
+        path = os.path.join(self.path, filename)
+        try:
+            mtime = os.path.getmtime(path)
+            if mtime == self._mtimes.get(filename):
+                return None
+
+            with open(path, 'rb') as data:
+                message = message_class()
+                message.ParseFromString(data.read())
+            self._mtimes[filename] = mtime
+            return message
+        except (IOError, OSError):
+            return None
+        except DecodeError as e:
+            log.warning('Could not load template cache %s: %s', path, e)
+            return None
+
+    def _save(self, filename, message):
+        if not self.path:
+            return
+
+        path = os.path.join(self.path, filename)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as data:
+                data.write(message.SerializeToString())
+            replace_file(tmp_path, path)
+            self._mtimes[filename] = os.path.getmtime(path)
+        except (IOError, OSError) as e:
+            log.warning('Could not save template cache %s: %s', path, e)
+
+
+_default_cache = None
+
+
+def set_default_template_cache(cache):
+    """ Cache used by all PGoApi instances created afterwards """
+    global _default_cache
+    _default_cache = cache
+
+
+def get_default_template_cache():
+    return _default_cache
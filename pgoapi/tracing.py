@@ -0,0 +1,274 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import os
+import time
+import logging
+import binascii
+import threading
+
+log = logging.getLogger(__name__)
+
+
+def _time_ns():
+    return int(time.time() * 1e9)
+
+
+def _random_id(size):
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+class Span:
+    """
+    A timed operation with attributes. Ids, timestamps and the status follow
+    the OpenTelemetry data model, so spans can be handed to it unchanged.
+    """
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self._tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else _random_id(16)
+        self.span_id = _random_id(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = _time_ns()
+        self.end_ns = None
+        self.error = None
+        # finished spans of the whole trace, kept by the root span
+        self.spans = [] if parent is None else parent.spans
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.error = '{}: {}'.format(type(error).__name__, error)
+
+    def get_duration(self):
+        """ Seconds, None while the span is running """
+        if self.end_ns is None:
+            return None
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def end(self):
+        self.end_ns = _time_ns()
+        self.spans.append(self)
+        self._tracer._end(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'attributes': self.attributes,
+            'status': {
+                'code': 'ERROR' if self.error else 'OK',
+                'message': self.error or ''
+            }
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is not None:
+            self.set_error(exc_value)
+        self._tracer._pop(self)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, error):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class SpanExporter:
+    def export(self, spans):
+        """ Called with all spans of a trace once its root span ended """
+        raise NotImplementedError()
+
+
+class InMemorySpanExporter(SpanExporter):
+    def __init__(self, max_traces=1000):
+        self.max_traces = max_traces
+        self._lock = threading.Lock()
+        self.traces = []
+
+    def export(self, spans):
+        with self._lock:
+            self.traces.append(spans)
+            del self.traces[:-self.max_traces]
+
+    def get_traces(self):
+        with self._lock:
+            return list(self.traces)
+
+
+class LoggingSpanExporter(SpanExporter):
+    """ Logs every trace as an indented tree with durations """
+
+    def __init__(self, logger=None, level=logging.INFO, min_duration=0):
+        self.log = logger or log
+        self.level = level
+        self.min_duration = min_duration
+
+    def export(self, spans):
+        root = spans[-1]
+        if root.get_duration() < self.min_duration:
+            return
+
+        children = {}
+        for span in spans:
+            children.setdefault(span.parent_id, []).append(span)
+
+        lines = []
+
+        def add(span, depth):
+            lines.append('{}{} {:.1f}ms {}{}'.format(
+                '  ' * depth, span.name, span.get_duration() * 1000,
+                span.attributes, ' ' + span.error if span.error else ''))
+            for child in sorted(
+                    children.get(span.span_id, []), key=lambda s: s.start_ns):
+                add(child, depth + 1)
+
+        add(root, 0)
+        self.log.log(self.level, 'Trace %s:\n%s', root.trace_id,
+                     '\n'.join(lines))
+
+
+class OpenTelemetrySpanExporter(SpanExporter):
+    """ Replays the spans into an OpenTelemetry tracer, needs opentelemetry-api """
+
+    def __init__(self, tracer=None):
+        from opentelemetry import trace
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer('pgoapi')
+
+    def export(self, spans):
+        started = {}
+        for span in sorted(spans, key=lambda s: s.start_ns):
+            parent = started.get(span.parent_id)
+            context = self._trace.set_span_in_context(
+                parent) if parent is not None else None
+            otel_span = self.tracer.start_span(
+                span.name,
+                context=context,
+                attributes=span.attributes,
+                start_time=span.start_ns)
+            if span.error:
+                otel_span.set_status(
+                    self._trace.Status(self._trace.StatusCode.ERROR,
+                                       span.error))
+            started[span.span_id] = otel_span
+
+        for span in spans:
+            started[span.span_id].end(end_time=span.end_ns)
+
+
+class Tracer:
+    """ Creates nested spans per thread and exports every finished trace """
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+        self._local = threading.local()
+
+    def _get_stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def get_current_span(self):
+        stack = self._get_stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name, **attributes):
+        """ Span as child of the current one, use it as context manager """
+        stack = self._get_stack()
+        span = Span(self, name, stack[-1] if stack else None, attributes)
+        stack.append(span)
+        return span
+
+    def _pop(self, span):
+        stack = self._get_stack()
+        if span in stack:
+            del stack[stack.index(span):]
+
+    def _end(self, span):
+        if span.parent is None:
+            try:
+                self.exporter.export(span.spans)
+            except Exception as e:
+                log.warning('Exporting trace %s failed: %s', span.trace_id, e)
+
+
+_tracer = None
+
+
+def set_tracer(tracer):
+    """ Enables tracing for the whole process, None disables it """
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def is_tracing_enabled():
+    """ Lets callers skip computing span attributes nobody records """
+    return _tracer is not None
+
+
+def span(name, **attributes):
+    """
+    with span('hash', requests=3) as current:
+        ...
+
+    Nested in the current span of the thread. A no-op without a tracer.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return tracer.start_span(name, **attributes)
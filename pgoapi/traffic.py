@@ -0,0 +1,309 @@
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+"""
+
+
+from __future__ import absolute_import
+
+import json
+import time
+import base64
+import struct
+import logging
+import threading
+
+from collections import namedtuple
+
+from requests import Response
+from requests.exceptions import ConnectionError
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from google.protobuf.message import DecodeError
+
+from pgoapi.hash_server import HashServer
+
+from . import protos
+from pogoprotos.networking.envelopes.request_envelope_pb2 import RequestEnvelope
+from pogoprotos.networking.envelopes.response_envelope_pb2 import ResponseEnvelope
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'PGOTRAFFIC1\n'
+
+# timestamp, HTTP status, length of url, request body and response body
+RECORD_HEADER = struct.Struct('<dHHII')
+
+Exchange = namedtuple('Exchange',
+                      ['timestamp', 'url', 'status', 'request', 'response'])
+
+SCRUBBED_TOKEN = 'scrubbed'
+
+
+def _scrub_ticket(ticket):
+    # same sizes, so scrubbed logs still benchmark like the original
+    ticket.start = b'\0' * len(ticket.start)
+    ticket.end = b'\0' * len(ticket.end)
+
+
+def scrub_exchange(request, response):
+    """
+    Returns (request, response) without credentials: the OAuth access token
+    and session tickets of RPC envelopes and the auth ticket sent to the
+    hashing server. Other bodies are returned unchanged.
+    """
+    if request.startswith(b'{'):
+        try:
+            payload = json.loads(request.decode('utf-8'))
+        except ValueError:
+            return request, response
+        if isinstance(payload, dict) and 'AuthTicket' in payload:
+            size = len(base64.b64decode(payload['AuthTicket']))
+            payload['AuthTicket'] = base64.b64encode(b'\0' *
+                                                     size).decode('ascii')
+            request = json.dumps(payload).encode('utf-8')
+        return request, response
+
+    envelope = RequestEnvelope()
+    try:
+        envelope.ParseFromString(request)
+    except DecodeError:
+        return request, response
+    if not envelope.HasField('auth_info') and not envelope.HasField(
+            'auth_ticket'):
+        return request, response
+
+    if envelope.HasField('auth_info'):
+        envelope.auth_info.token.contents = SCRUBBED_TOKEN
+    if envelope.HasField('auth_ticket'):
+        _scrub_ticket(envelope.auth_ticket)
+    request = envelope.SerializeToString()
+
+    envelope = ResponseEnvelope()
+    try:
+        envelope.ParseFromString(response)
+    except DecodeError:
+        return request, response
+    if envelope.HasField('auth_ticket'):
+        _scrub_ticket(envelope.auth_ticket)
+        response = envelope.SerializeToString()
+    return request, response
+
+
+def read_traffic_log(path):
+    """ Yields the Exchanges of a traffic log in recorded order """
+    with open(path, 'rb') as data:
+        if data.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a traffic log.'.format(path))
+
+        while True:
+            header = data.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, status, url_size, request_size, response_size = RECORD_HEADER.unpack(
+                header)
+            url = data.read(url_size).decode('utf-8')
+            request = data.read(request_size)
+            response = data.read(response_size)
+            if len(response) < response_size:
+                log.warning('Truncated last record in %s', path)
+                return
+            yield Exchange(timestamp, url, status, request, response)
+
+
+class TrafficRecorder:
+    """
+    Appends exchanges to a traffic log file, thread safe. Credentials are
+    scrubbed from the bodies unless scrub is False, the log then contains
+    live access tokens and session tickets.
+    """
+
+    def __init__(self, path, scrub=True):
+        self.path = path
+        self.scrub = scrub
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._mounts = []
+
+    def record(self, url, request, status, response):
+        url = url.encode('utf-8')
+        request = request or b''
+        if not isinstance(request, bytes):
+            request = request.encode('utf-8')
+        response = response or b''
+        if self.scrub:
+            request, response = scrub_exchange(request, response)
+
+        with self._lock:
+            self._file.write(
+                RECORD_HEADER.pack(time.time(), status, len(url),
+                                   len(request), len(response)))
+            self._file.write(url)
+            self._file.write(request)
+            self._file.write(response)
+            self._file.flush()
+
+    def mount(self, session, prefix='https://'):
+        """ Records everything session sends to prefix, undone by close() """
+        adapter = session.get_adapter(prefix)
+        self._mounts.append((session, prefix, adapter))
+        session.mount(prefix, RecordingAdapter(self, adapter))
+
+    def close(self):
+        for session, prefix, adapter in reversed(self._mounts):
+            session.mount(prefix, adapter)
+        self._mounts = []
+        with self._lock:
+            self._file.close()
+
+
+class RecordingAdapter(BaseAdapter):
+    """
+    Records the exchanges of the wrapped adapter. Streamed responses (the
+    ones sent with a deadline) are recorded once the caller read the whole
+    body, so the deadline still applies to reading it; bodies cut off by
+    the deadline are not recorded.
+    """
+
+    def __init__(self, recorder, adapter=None):
+        BaseAdapter.__init__(self)
+        self.recorder = recorder
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        # the session reads the body right away anyway, and an adapter may
+        # have loaded it already
+        if not kwargs.get('stream') or response._content is not False:
+            self.recorder.record(request.url, request.body,
+                                 response.status_code, response.content)
+            return response
+
+        iter_content = response.iter_content
+        recorder = self.recorder
+
+        def recording_iter_content(*args, **kwargs):
+            chunks = []
+            for chunk in iter_content(*args, **kwargs):
+                chunks.append(chunk)
+                yield chunk
+            recorder.record(request.url, request.body, response.status_code,
+                            b''.join(chunks))
+
+        response.iter_content = recording_iter_content
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Serves the responses of a traffic log instead of the network. Request
+    envelopes are never identical twice (time, random sensor data), so
+    responses are served per URL in recorded order, from the start again
+    with loop=True.
+    """
+
+    def __init__(self, path, loop=False):
+        BaseAdapter.__init__(self)
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._exchanges = {}
+        self._positions = {}
+        self._mounts = []
+        for exchange in read_traffic_log(path):
+            self._exchanges.setdefault(exchange.url, []).append(exchange)
+
+    def get_urls(self):
+        return list(self._exchanges)
+
+    def _next(self, url):
+        exchanges = self._exchanges.get(url)
+        if not exchanges:
+            raise ConnectionError('No recorded response for {}.'.format(url))
+
+        with self._lock:
+            position = self._positions.get(url, 0)
+            if position >= len(exchanges):
+                if not self.loop:
+                    raise ConnectionError(
+                        'All recorded responses for {} served.'.format(url))
+                position = 0
+            self._positions[url] = position + 1
+        return exchanges[position]
+
+    def send(self, request, **kwargs):
+        exchange = self._next(request.url)
+
+        response = Response()
+        response.status_code = exchange.status
+        response._content = exchange.response
+        response.headers = CaseInsensitiveDict()
+        response.url = request.url
+        response.request = request
+        response.encoding = 'utf-8'
+        return response
+
+    def mount(self, session, prefix='https://'):
+        """ Serves everything session sends to prefix, undone by unmount() """
+        self._mounts.append((session, prefix, session.get_adapter(prefix)))
+        session.mount(prefix, self)
+
+    def unmount(self):
+        """ Restores the adapters replaced by mount() """
+        for session, prefix, adapter in reversed(self._mounts):
+            session.mount(prefix, adapter)
+        self._mounts = []
+
+    def close(self):
+        pass
+
+
+def record_traffic(api, path, scrub=True):
+    """
+    Records the RPC and hashing server traffic of a PGoApi instance to path
+    until close() of the returned TrafficRecorder. The hashing server
+    session is shared, so its traffic is recorded for every instance.
+    Headers are not recorded and credentials in the bodies are scrubbed,
+    see TrafficRecorder.
+    """
+    recorder = TrafficRecorder(path, scrub)
+    recorder.mount(api._session)
+    recorder.mount(HashServer._session)
+    return recorder
+
+
+def replay_traffic(api, path, loop=False):
+    """
+    Answers the RPC and hashing requests of api from a traffic log until
+    unmount() of the returned ReplayAdapter. The hashing server session is
+    shared, so hashing is replayed for every instance meanwhile.
+    """
+    adapter = ReplayAdapter(path, loop)
+    for session in (api._session, HashServer._session):
+        adapter.mount(session, 'https://')
+        adapter.mount(session, 'http://')
+    return adapter
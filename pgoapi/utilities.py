@@ -19,14 +19,21 @@ OR OTHER DEALINGS IN THE SOFTWARE.
 Author: tjado <https://github.com/tejado>
 """
 
+import os
 import time
+import heapq
+import socket
 import struct
 import random
 import logging
+import threading
 
 from json import JSONEncoder
+from itertools import count
 from binascii import unhexlify
 
+from pgoapi.exceptions import DeadlineExceededException
+
 # other stuff
 from geopy.geocoders import GoogleV3
 from s2sphere import LatLng, Angle, Cap, RegionCoverer, math
@@ -94,6 +101,17 @@ def get_cell_ids(lat, long, radius=500):
     return sorted([x.id() for x in cells])
 
 
+def replace_file(src, dst):
+    """ os.replace, rename does not overwrite dst on Windows """
+    replace = getattr(os, 'replace', None)
+    if replace is not None:
+        return replace(src, dst)
+    # Python 2
+    if os.name == 'nt' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
 def get_time(ms=False):
     if ms:
         return int(time.time() * 1000)
@@ -101,6 +119,152 @@ def get_time(ms=False):
         return int(time.time())
 
 
+class Deadline:
+    """
+    Time budget of a single call. It is handed down to every HTTP request
+    the call performs (auth refresh, hashing, RPC, redirects) so the call
+    as a whole never takes longer than the budget.
+
+    Google logins can't be interrupted, gpsoauth has no timeouts. The
+    deadline is only checked before and after them.
+    """
+
+    def __init__(self, timeout=None):
+        if timeout is None:
+            self.expires = None
+        else:
+            self.expires = time.time() + timeout
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return max(0, self.expires - time.time())
+
+    def expired(self):
+        return self.expires is not None and time.time() >= self.expires
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceededException('Call deadline exceeded.')
+
+    def get_timeout(self, connect_timeout, read_timeout):
+        """
+        Returns a (connect, read) timeout tuple for requests. Together they
+        stay within the remaining budget, connecting gets at most half of it.
+        """
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return (connect_timeout, read_timeout)
+        connect_timeout = min(connect_timeout, remaining / 2.0)
+        return (connect_timeout, min(read_timeout, remaining - connect_timeout))
+
+
+def get_request_timeout(connect_timeout, read_timeout, deadline=None):
+    if deadline is None:
+        return (connect_timeout, read_timeout)
+    return deadline.get_timeout(connect_timeout, read_timeout)
+
+
+def send_request(session, method, url, timeout, deadline=None, **kwargs):
+    """
+    session.request() keeping to the deadline for the whole response. The
+    socket timeouts only limit every single read, so with a deadline the
+    body is streamed and the shared watchdog thread shuts the connection
+    down once the budget is spent.
+    """
+    if deadline is None or deadline.expires is None:
+        return session.request(method, url, timeout=timeout, **kwargs)
+
+    response = session.request(
+        method, url, timeout=timeout, stream=True, **kwargs)
+    key = _watchdog.watch(deadline.expires, response)
+    try:
+        response.content
+    except Exception:
+        response.close()
+        if deadline.expired():
+            raise DeadlineExceededException(
+                'Call deadline exceeded while reading the response.')
+        raise
+    finally:
+        _watchdog.unwatch(key)
+    return response
+
+
+def _abort_response(response):
+    connection = getattr(response.raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    try:
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+        else:
+            response.raw.close()
+    except Exception as e:
+        log.debug('Aborting the response failed: %s', e)
+
+
+class _Watchdog:
+    """ A single thread aborting the responses whose deadline passed """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._queue = []
+        self._responses = {}
+        self._counter = count()
+        self._thread = None
+
+    def watch(self, expires, response):
+        with self._condition:
+            key = next(self._counter)
+            self._responses[key] = response
+            heapq.heappush(self._queue, (expires, key))
+            # not alive in a forked child either
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='DeadlineWatchdog')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        return key
+
+    def unwatch(self, key):
+        with self._condition:
+            self._responses.pop(key, None)
+            # finished entries are dropped lazily, compact now and then
+            if len(self._queue) > 2 * len(self._responses) + 64:
+                self._queue = [
+                    entry for entry in self._queue
+                    if entry[1] in self._responses
+                ]
+                heapq.heapify(self._queue)
+
+    def _next(self):
+        with self._condition:
+            while True:
+                while self._queue and self._queue[0][1] not in self._responses:
+                    heapq.heappop(self._queue)
+                if not self._queue:
+                    self._condition.wait()
+                    continue
+
+                expires, key = self._queue[0]
+                delay = expires - time.time()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                heapq.heappop(self._queue)
+                return self._responses.pop(key)
+
+    def _run(self):
+        while True:
+            _abort_response(self._next())
+
+
+_watchdog = _Watchdog()
+
+
 def get_format_time_diff(low, high, ms=True):
     diff = (high - low)
     if ms:
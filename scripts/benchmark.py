@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+
+Micro benchmarks of the protocol hot paths. No network access is needed,
+the hashing server is replaced by a stub engine or a local stub server.
+
+Results can be stored as a baseline with --save and later runs checked
+against it with --compare, which exits with 1 if a benchmark got slower
+than the tolerance allows. Baselines are only comparable on the machine
+they were recorded on.
+
+scripts/benchmark-baseline.json is the committed reference baseline,
+recorded with --save on CPython 3.11 with the pure Python protobuf runtime:
+
+    python scripts/benchmark.py --compare scripts/benchmark-baseline.json
+
+It leaves out the build_main_request and encrypt benchmarks, which depend
+on the installed pycrypt build, and the replay benchmarks of --traffic.
+Re-record it with --save after changing the machine or the runtime.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import timeit
+import logging
+import argparse
+import threading
+
+from six.moves import BaseHTTPServer, socketserver
+
+# add the repository root to PATH, so that the package will be found
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from pgoapi import PGoApi
+from pgoapi.auth import Auth
+from pgoapi.hash_engine import HashEngine
+from pgoapi.rpc_api import RpcApi, RpcState
+from pgoapi.hash_server import HashServer
+from pgoapi.synthetic import PayloadGenerator
+from pgoapi.signature_encryptor import SignatureEncryptor, PoolSignatureEncryptor
+from pgoapi.traffic import read_traffic_log, replay_traffic
+from pgoapi.utilities import f2i, get_cell_ids, get_time
+
+from protobuf_to_dict import protobuf_to_dict
+
+from pogoprotos.networking.envelopes.request_envelope_pb2 import RequestEnvelope
+from pogoprotos.networking.requests.request_type_pb2 import RequestType
+
+POSITION = (40.7127837, -74.005941, 12.0)
+
+DEVICE_INFO = {
+    'device_id': '8b8b7b9e5aa04b1cbf8b0a5b8e5a9c4d',
+    'device_brand': 'Apple',
+    'device_model': 'iPhone',
+    'device_model_boot': 'iPhone9,3',
+    'hardware_manufacturer': 'Apple',
+    'hardware_model': 'D10AP',
+    'firmware_brand': 'iPhone OS',
+    'firmware_type': '10.3.3'
+}
+
+BATCH_SIZE = 64
+
+
+class StubHashEngine(HashEngine):
+    def hash(self, timestamp, latitude, longitude, accuracy, authticket,
+             sessiondata, requests):
+        self.location_hash = 1234567
+        self.location_auth_hash = -7654321
+        self.request_hashes = [-1234567890123 + i for i in range(len(requests))]
+
+
+class StubAuth(Auth):
+    def __init__(self, ticket=True):
+        Auth.__init__(self)
+        self._auth_provider = 'ptc'
+        self._login = True
+        self._access_token = 'TGT-1234567-abcdefghijklmnopqrstuvwxyz-sso.pokemon.com'
+        if ticket:
+            self.set_ticket([
+                get_time(ms=True) + 30 * 60 * 1000,
+                os.urandom(64),
+                os.urandom(32)
+            ])
+
+    def get_access_token(self, force_refresh=False, deadline=None):
+        return self._access_token
+
+
+class CaptureEncryptor(SignatureEncryptor):
+    def encrypt(self, signature, timestamp_since_start):
+        self.signature = (signature, timestamp_since_start)
+        return SignatureEncryptor.encrypt(self, signature,
+                                          timestamp_since_start)
+
+
+def create_rpc(ticket=True, device_info=None):
+    rpc = RpcApi(StubAuth(ticket), device_info, RpcState(), 1,
+                 get_time(ms=True) - 8000)
+    rpc._hash_engine = StubHashEngine()
+    return rpc
+
+
+def get_map_objects_request():
+    cell_ids = get_cell_ids(POSITION[0], POSITION[1])
+    return [(RequestType.Value('GET_MAP_OBJECTS'), {
+        'latitude': f2i(POSITION[0]),
+        'longitude': f2i(POSITION[1]),
+        'since_timestamp_ms': [0] * len(cell_ids),
+        'cell_id': cell_ids
+    }), (RequestType.Value('CHECK_CHALLENGE'), None),
+            (RequestType.Value('GET_HATCHED_EGGS'), None),
+            (RequestType.Value('GET_INVENTORY'), {
+                'last_timestamp_ms': 0
+            }), (RequestType.Value('CHECK_AWARDED_BADGES'), None)]
+
+
+def bench_build_main_request():
+    rpc = create_rpc()
+    subrequests = get_map_objects_request()
+    return lambda: rpc._build_main_request(subrequests, [], POSITION)
+
+
+def bench_build_main_request_empty():
+    rpc = create_rpc(device_info=DEVICE_INFO)
+    return lambda: rpc._build_main_request([], [], POSITION)
+
+
+def bench_build_main_request_device_info():
+    rpc = create_rpc(device_info=DEVICE_INFO)
+    subrequests = get_map_objects_request()
+    return lambda: rpc._build_main_request(subrequests, [], POSITION)
+
+
+def bench_build_main_request_oauth():
+    rpc = create_rpc(ticket=False)
+    subrequests = get_map_objects_request()
+    return lambda: rpc._build_main_request(subrequests, [], POSITION)
+
+
+def get_signature():
+    rpc = create_rpc(device_info=DEVICE_INFO)
+    encryptor = CaptureEncryptor()
+    rpc.set_signature_encryptor(encryptor)
+    rpc._build_main_request(get_map_objects_request(), [], POSITION)
+    return encryptor.signature
+
+
+def bench_encrypt_signature():
+    encryptor = SignatureEncryptor()
+    signature, timestamp = get_signature()
+    return lambda: encryptor.encrypt(signature, timestamp)
+
+
+def bench_encrypt_pool(processes):
+    def setup():
+        encryptor = PoolSignatureEncryptor(processes=processes)
+        signature, timestamp = get_signature()
+
+        # BATCH_SIZE callers at once, like the accounts of an AccountPool
+        def encrypt_pool():
+            results = [
+                encryptor.encrypt_async(signature, timestamp)
+                for i in range(BATCH_SIZE)
+            ]
+            for result in results:
+                result.get()
+
+        encrypt_pool.close = encryptor.close
+        return encrypt_pool
+
+    return setup
+
+
+class RecordedResponse:
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+def get_map_objects_response(cells):
+    return PayloadGenerator(seed=cells).get_map_objects_response(cells=cells)
+
+
+def get_inventory_response(items):
+    return PayloadGenerator(seed=items).get_inventory_response(pokemon=items)
+
+
+def get_envelope_response(request_type, response):
+    """ (subrequests, http response) of a response envelope with one return """
+    return ([(RequestType.Value(request_type), None)],
+            RecordedResponse(200,
+                             PayloadGenerator().get_response_envelope(
+                                 [response], request_id=1)))
+
+
+def bench_build_sub_requests():
+    rpc = create_rpc()
+    subrequests = get_map_objects_request()
+    return lambda: rpc._build_sub_requests(RequestEnvelope(), subrequests)
+
+
+def bench_get_proto_bytes():
+    rpc = create_rpc()
+    params = get_map_objects_request()[0][1]
+    return lambda: rpc._get_proto_bytes(
+        'pogoprotos.networking.requests.messages.', 'get_map_objects_message',
+        params)
+
+
+def bench_parse(request_type, response, use_dict):
+    def setup():
+        rpc = create_rpc()
+        subrequests, http_response = get_envelope_response(
+            request_type, response())
+        return lambda: rpc._parse_main_response(http_response, subrequests,
+                                                use_dict)
+
+    return setup
+
+
+def bench_protobuf_to_dict(response):
+    def setup():
+        message = response()
+        return lambda: protobuf_to_dict(message)
+
+    return setup
+
+
+def bench_get_cell_ids():
+    return lambda: get_cell_ids(POSITION[0], POSITION[1])
+
+
+class StubHashHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        payload = json.loads(
+            self.rfile.read(int(self.headers['Content-Length'])).decode(
+                'utf-8'))
+        body = json.dumps({
+            'locationAuthHash': 1234567,
+            'locationHash': -7654321,
+            'requestHashes': [-1234567890123] * len(payload['Requests'])
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHashServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    # keep-alive connections must not block shutdown()
+    daemon_threads = True
+
+
+def bench_hash_server():
+    """ HashServer.hash over HTTP against a stub server on localhost """
+    server = StubHashServer(('127.0.0.1', 0), StubHashHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    hash_server = HashServer('stub')
+    hash_server.endpoint = 'http://127.0.0.1:{}/hash'.format(
+        server.server_address[1])
+    rpc = create_rpc()
+    request = rpc._build_sub_requests(RequestEnvelope(),
+                                      get_map_objects_request())
+    auth_ticket = os.urandom(64)
+    session_data = os.urandom(16)
+
+    def hash_requests():
+        hash_server.hash(get_time(ms=True), POSITION[0], POSITION[1], 5.0,
+                         auth_ticket, session_data, request.requests)
+
+    def close():
+        server.shutdown()
+        server.server_close()
+
+    hash_requests.close = close
+    return hash_requests
+
+
+def get_recorded_rpcs(path):
+    """ (subrequests, response) of every RPC exchange in a traffic log """
+    rpcs = []
+    for exchange in read_traffic_log(path):
+        if exchange.url == HashServer.endpoint:
+            continue
+        envelope = RequestEnvelope()
+        envelope.ParseFromString(exchange.request)
+        subrequests = [(request.request_type, None)
+                       for request in envelope.requests]
+        rpcs.append((exchange.url, subrequests,
+                     RecordedResponse(exchange.status, exchange.response)))
+    return rpcs
+
+
+def bench_replay_parse(rpcs, use_dict):
+    rpc = create_rpc()
+
+    def parse():
+        for _, subrequests, response in rpcs:
+            rpc._parse_main_response(response, subrequests, use_dict)
+
+    return parse
+
+
+def bench_replay_call(path, rpcs):
+    """ End-to-end calls answered by the replayed RPC and hashing traffic """
+    api = PGoApi()
+    api._auth_provider = StubAuth()
+    api.set_position(*POSITION)
+    api.activate_hash_server('replay')
+    replay = replay_traffic(api, path, loop=True)
+
+    def call():
+        for url, subrequests, _ in rpcs:
+            api.set_api_endpoint(url)
+            request = api.create_request()
+            for request_type, _ in subrequests:
+                getattr(request, RequestType.Name(request_type).lower())()
+            request.call()
+
+    call.close = replay.unmount
+    return call
+
+
+def get_traffic_benchmarks(path):
+    rpcs = get_recorded_rpcs(path)
+    return [
+        ('replay_parse_dict', lambda: bench_replay_parse(rpcs, True),
+         len(rpcs)),
+        ('replay_parse_proto', lambda: bench_replay_parse(rpcs, False),
+         len(rpcs)),
+        ('replay_call', lambda: bench_replay_call(path, rpcs), len(rpcs)),
+    ]
+
+
+# (name, setup, operations per call)
+BENCHMARKS = [
+    ('build_main_request', bench_build_main_request, 1),
+    ('build_main_request_empty', bench_build_main_request_empty, 1),
+    ('build_main_request_device_info', bench_build_main_request_device_info, 1),
+    ('build_main_request_oauth', bench_build_main_request_oauth, 1),
+    ('encrypt_signature', bench_encrypt_signature, 1),
+    ('encrypt_pool_threads', bench_encrypt_pool(False), BATCH_SIZE),
+    ('encrypt_pool_processes', bench_encrypt_pool(True), BATCH_SIZE),
+    ('build_sub_requests', bench_build_sub_requests, 1),
+    ('get_proto_bytes', bench_get_proto_bytes, 1),
+    ('get_cell_ids', bench_get_cell_ids, 1),
+    ('hash_server_local', bench_hash_server, 1),
+]
+
+for size in (10, 100):
+    BENCHMARKS += [
+        ('parse_map_objects_dict_{}'.format(size),
+         bench_parse('GET_MAP_OBJECTS',
+                     lambda size=size: get_map_objects_response(size), True), 1),
+        ('parse_map_objects_proto_{}'.format(size),
+         bench_parse('GET_MAP_OBJECTS',
+                     lambda size=size: get_map_objects_response(size), False), 1),
+        ('protobuf_to_dict_map_objects_{}'.format(size),
+         bench_protobuf_to_dict(lambda size=size: get_map_objects_response(size)), 1),
+    ]
+
+for size in (100, 2000):
+    BENCHMARKS += [
+        ('parse_inventory_dict_{}'.format(size),
+         bench_parse('GET_INVENTORY',
+                     lambda size=size: get_inventory_response(size), True), 1),
+        ('parse_inventory_proto_{}'.format(size),
+         bench_parse('GET_INVENTORY',
+                     lambda size=size: get_inventory_response(size), False), 1),
+        ('protobuf_to_dict_inventory_{}'.format(size),
+         bench_protobuf_to_dict(lambda size=size: get_inventory_response(size)), 1),
+    ]
+
+
+def run(name, setup, number, repeat, operations):
+    """ setup returns the function to time, its close() is called afterwards """
+    func = setup()
+    try:
+        if not number:
+            # calibrate to at least 0.2s per repetition
+            number = 1
+            while timeit.timeit(
+                    func, number=number) < 0.2 and number < 1000000:
+                number *= 2
+        timings = timeit.repeat(func, number=number, repeat=repeat)
+    finally:
+        close = getattr(func, 'close', None)
+        if close is not None:
+            close()
+    return min(timings) / (number * operations)
+
+
+def compare(results, baseline, tolerance):
+    """ Prints the change against the baseline, returns the regressed names """
+    regressions = []
+    for name, seconds in results:
+        if name not in baseline:
+            continue
+        change = seconds / baseline[name] - 1
+        if change > tolerance:
+            regressions.append(name)
+        print('{:<40} {:>+11.1f}% {}'.format(
+            name, change * 100, 'REGRESSION' if change > tolerance else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-f", "--filter", help="Only run benchmarks containing this string")
+    parser.add_argument(
+        "-n", "--number", type=int, default=0,
+        help="Calls per repetition, calibrated by default")
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Repetitions")
+    parser.add_argument(
+        "-t", "--traffic",
+        help="Traffic log of pgoapi.traffic to benchmark replayed responses")
+    parser.add_argument(
+        "-s", "--save", help="Store the results as baseline in this file")
+    parser.add_argument(
+        "-c", "--compare", help="Compare the results to this baseline file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="Allowed slowdown against the baseline (default 0.2 = 20%%)")
+    config = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    benchmarks = list(BENCHMARKS)
+    if config.traffic:
+        benchmarks += get_traffic_benchmarks(config.traffic)
+
+    results = []
+    for name, setup, operations in benchmarks:
+        if config.filter and config.filter not in name:
+            continue
+        seconds = run(name, setup, config.number, config.repeat, operations)
+        results.append((name, seconds))
+        print('{:<40} {:>12.1f} us/op {:>12.0f} ops/s'.format(
+            name, seconds * 1e6, 1 / seconds))
+
+    if config.save:
+        baseline = {}
+        if os.path.isfile(config.save):
+            with open(config.save) as data:
+                baseline = json.load(data)
+        baseline.update(results)
+        with open(config.save, 'w') as data:
+            json.dump(baseline, data, indent=2, sort_keys=True)
+
+    if config.compare:
+        with open(config.compare) as data:
+            baseline = json.load(data)
+        print('')
+        if compare(results, baseline, config.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+
+
+Soak test of long running sessions against a mock server: accounts of an
+AccountPool call GET_MAP_OBJECTS and GET_INVENTORY in a loop, answered from
+a traffic log of synthetic responses (or a recorded one with --traffic),
+while the memory diagnostics report the growth of RSS, object counts and
+allocations. Exits with 1 if a pgoapi type grew by more than --max-objects.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import requests
+import tempfile
+import threading
+
+# add the repository root to PATH, so that the package will be found
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from pgoapi import PGoApi
+from pgoapi.account_pool import AccountPool
+from pgoapi.hash_server import HashServer
+from pgoapi.memory import start_memory_monitor, stop_memory_monitor
+from pgoapi.pgoapi import DEFAULT_API_ENDPOINT, SESSION_VERSION
+from pgoapi.synthetic import PayloadGenerator
+from pgoapi.traffic import TrafficRecorder, replay_traffic
+from pgoapi.utilities import f2i, get_cell_ids, get_time
+
+POSITION = (40.7589, -73.9851, 10.0)
+
+
+def write_synthetic_traffic(path, responses, cells, pokemon):
+    recorder = TrafficRecorder(path)
+    for seed in range(responses):
+        generator = PayloadGenerator(seed, POSITION[0], POSITION[1])
+        recorder.record(DEFAULT_API_ENDPOINT, None, 200,
+                        generator.get_response_envelope([
+                            generator.get_map_objects_response(cells=cells),
+                            generator.get_inventory_response(pokemon=pokemon)
+                        ]))
+        recorder.record(HashServer.endpoint, None, 200,
+                        json.dumps({
+                            'locationAuthHash': seed,
+                            'locationHash': -seed,
+                            'requestHashes': [seed, -seed]
+                        }).encode('utf-8'))
+    recorder.close()
+
+
+def create_api(name, path, provider, adapter):
+    api = PGoApi()
+    api.restore_session({
+        'version': SESSION_VERSION,
+        'auth': {
+            'provider': provider,
+            'username': name,
+            'login': True,
+            'access_token': 'TGT-soak-' + name,
+            'access_token_expiry': time.time() + 365 * 86400,
+            'ticket': [(get_time() + 365 * 86400) * 1000,
+                       'c3RhcnQ=', 'ZW5k']
+        },
+        'api_endpoint': DEFAULT_API_ENDPOINT,
+        'rpc_id_low': 1,
+        'rpc_id_high': 1,
+        'start_time': get_time(ms=True) - 60000,
+        'state': api.state.get_state()
+    }, timeout=10, connect_timeout=5, adapter=adapter)
+    api.set_position(*POSITION)
+    api.activate_hash_server('soak')
+    replay_traffic(api, path, loop=True)
+    return api
+
+
+def scan(api, use_dict):
+    cell_ids = get_cell_ids(POSITION[0], POSITION[1])
+    request = api.create_request()
+    request.get_map_objects(
+        latitude=f2i(POSITION[0]),
+        longitude=f2i(POSITION[1]),
+        since_timestamp_ms=[0] * len(cell_ids),
+        cell_id=cell_ids)
+    request.get_inventory()
+    return request.call(use_dict=use_dict)
+
+
+def worker(pool, end, use_dict, calls, errors):
+    while time.time() < end:
+        try:
+            pool.run(lambda api: scan(api, use_dict))
+        except Exception as e:
+            errors.append(e)
+        calls.append(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-d", "--duration", type=float, default=300, help="Seconds to run")
+    parser.add_argument(
+        "-a", "--accounts", type=int, default=8, help="Number of accounts")
+    parser.add_argument(
+        "-t", "--threads", type=int, default=4, help="Number of threads")
+    parser.add_argument(
+        "-i", "--interval", type=float, default=60,
+        help="Seconds between memory snapshots")
+    parser.add_argument(
+        "--traffic",
+        help="Traffic log of pgoapi.traffic to replay instead of synthetic responses")
+    parser.add_argument(
+        "--responses", type=int, default=20,
+        help="Distinct synthetic responses")
+    parser.add_argument(
+        "--cells", type=int, default=20, help="Map cells per response")
+    parser.add_argument(
+        "--pokemon", type=int, default=250, help="Pokemon per inventory")
+    parser.add_argument(
+        "--proto", action='store_true',
+        help="Parse into protobuf messages instead of dicts")
+    parser.add_argument(
+        "--max-objects", type=int, default=100,
+        help="Allowed growth of the instances of a pgoapi type")
+    config = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+    logging.getLogger('pgoapi').setLevel(logging.WARNING)
+    logging.getLogger('pgoapi.memory').setLevel(logging.INFO)
+
+    path = config.traffic
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.log')
+        os.close(handle)
+        os.remove(path)
+        write_synthetic_traffic(path, config.responses, config.cells,
+                                config.pokemon)
+
+    try:
+        # a mix of ptc and google accounts, restored with the same options
+        adapter = requests.adapters.HTTPAdapter()
+        pool = AccountPool(min_interval=0)
+        for i in range(config.accounts):
+            name = 'soak-{}'.format(i)
+            provider = ('ptc', 'google')[i % 2]
+            api = create_api(name, path, provider, adapter)
+            if api.get_auth_provider().get_name() != provider:
+                raise RuntimeError('Restored {} as a {} account.'.format(
+                    name, api.get_auth_provider().get_name()))
+            pool.add(api, name)
+
+        # one warm up round, so that lazy imports and caches are in the baseline
+        scan(pool.get_accounts()[0].api, not config.proto)
+
+        monitor = start_memory_monitor(config.interval)
+        calls = []
+        errors = []
+        end = time.time() + config.duration
+        threads = [
+            threading.Thread(
+                target=worker,
+                args=(pool, end, not config.proto, calls, errors))
+            for i in range(config.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        baseline = monitor.baseline
+        report = stop_memory_monitor()
+    finally:
+        if config.traffic is None:
+            os.remove(path)
+
+    print(report)
+    print('Calls: {}, errors: {}'.format(len(calls), len(errors)))
+    for error in errors[:5]:
+        print('  {!r}'.format(error))
+
+    leaks = [
+        name for name, count in monitor.last.object_counts.items()
+        if name.startswith('pgoapi.') and
+        count - baseline.object_counts.get(name, 0) > config.max_objects
+    ]
+    if leaks:
+        print('Leaking: {}'.format(', '.join(sorted(leaks))))
+    if leaks or errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
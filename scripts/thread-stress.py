@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+pgoapi - Pokemon Go API
+Copyright (c) 2016 tjado <https://github.com/tejado>
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE
+OR OTHER DEALINGS IN THE SOFTWARE.
+
+Author: tjado <https://github.com/tejado>
+
+Stress test of a single PGoApi instance shared by many threads: request ids
+have to be unique, request objects must never see a torn position and the
+session ticket must never be torn or replaced by an older one.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import random
+import logging
+import argparse
+import threading
+
+# add the repository root to PATH, so that the package will be found
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from pgoapi import PGoApi
+from pgoapi.auth_ptc import AuthPtc
+from pgoapi.rpc_api import RpcApi
+from pgoapi.utilities import get_time
+
+
+def stress(api, iterations, request_ids, errors, ticket_errors, offered):
+    # responses of concurrent calls hand in tickets out of order
+    rpc = RpcApi(api.get_auth_provider(), None, api.state, 0, 0)
+    base = (get_time() + 3600) * 1000
+    last_seen = 0
+
+    ids = []
+    for i in range(iterations):
+        expire = base + random.randint(0, 10 * iterations)
+        offered.append(expire)
+        rpc.check_authentication(expire, str(expire).encode('ascii'),
+                                 str(-expire).encode('ascii'))
+
+        ticket = api.get_auth_provider().get_ticket()
+        if ticket[1] != str(ticket[0]).encode('ascii') or ticket[2] != str(
+                -ticket[0]).encode('ascii'):
+            ticket_errors.append(('torn', ticket))
+        elif ticket[0] < last_seen:
+            ticket_errors.append(('older', last_seen, ticket[0]))
+        last_seen = max(last_seen, ticket[0])
+
+        value = float(i)
+        api.set_position(value, value, value)
+
+        request = api.create_request()
+        lat, lng, alt = request.get_position()
+        if not lat == lng == alt:
+            errors.append((lat, lng, alt))
+
+        ids.append(api.get_next_request_id())
+        api.state.course
+
+    request_ids.extend(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-t", "--threads", type=int, default=16, help="Number of threads")
+    parser.add_argument(
+        "-i", "--iterations", type=int, default=20000,
+        help="Iterations per thread")
+    config = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    api = PGoApi()
+    api.set_auth_provider(AuthPtc())
+    request_ids = []
+    errors = []
+    ticket_errors = []
+    offered = []
+
+    threads = [
+        threading.Thread(
+            target=stress,
+            args=(api, config.iterations, request_ids, errors, ticket_errors,
+                  offered))
+        for i in range(config.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    duplicates = len(request_ids) - len(set(request_ids))
+    print('Request ids: {}, duplicates: {}'.format(
+        len(request_ids), duplicates))
+    print('Torn positions: {}'.format(len(errors)))
+
+    # the newest ticket offered has to be the one that is left
+    stored = api.get_auth_provider().get_ticket()[0]
+    if stored != max(offered):
+        ticket_errors.append(('final', max(offered), stored))
+    print('Ticket errors: {}'.format(len(ticket_errors)))
+    for error in ticket_errors[:5]:
+        print('  {}'.format(error))
+
+    if duplicates or errors or ticket_errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()